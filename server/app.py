@@ -1,4 +1,4 @@
-from flask import Flask, render_template, abort, request, redirect, url_for, flash, session, jsonify, send_file, send_from_directory
+from flask import Flask, render_template, abort, request, redirect, url_for, flash, session, jsonify, send_file, Response, stream_with_context
 # from flask_wtf import CSRFProtect
 from flask_login import login_user, LoginManager, current_user, logout_user, login_required
 import uuid
@@ -9,47 +9,67 @@ from urllib.parse import urlencode
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
 import time
-from werkzeug.utils import secure_filename
 import os
 import re
-from models import db, User, Product, Image, Wishlist, Transaction
-from flask_mail import Mail, Message
-from sqlalchemy import func
+from models import db, User, Product, Image, Wishlist, Transaction, UploadSession
+from database import configure_database
+from flask_mail import Mail
+from flask_migrate import Migrate
 import shutil
+import tempfile
 import pyotp
 from datetime import datetime, timedelta, timezone
-from mail_file import send_contact_email, send_transaction_mail, CONTRACT_LINK
+from mail_file import transaction_mails, contact_mail, welcome_mail, otp_mail
 from contract import get_balance_and_autowithdrawStatus
+from mail_queue import MailQueue, enqueue
+from metrics import Metrics
+from indexer import EventIndexer
+from catalog import get_page, CatalogError, BRANDS
+from history import HistoryError, get_page as get_transaction_page, summary as transaction_summary
+from facets import FacetCache
+from cache import ResponseCache
+from identity import IdentityCache, normalize_address
+from storage import Storage
+from images import ImagePipeline
+from inventory import Inventory, InventoryError, import_products, export_products
+from uploads import Uploads, UploadError, stored_urls, new_image, append_chunk, upload_offset
+from money import MoneyError, eth_to_gwei, wei_to_gwei
+from search import search_products, include_object
+from wishlists import WishlistError, product_ids_from, add_products, remove_products, wishlist_products
+from reconcile import reconcile_transactions, MAX_WORKERS, RPC_ERRORS
+import click
 
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cars.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'sqlite:///cars.db')
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
 app.config['MAIL_PORT'] = 587
 app.config['MAIL_USE_TLS'] = True
 app.config['MAIL_USERNAME'] = os.getenv("MAIL_USERNAME")   
 app.config['MAIL_PASSWORD'] =  os.getenv("MAIL_PASSWORD")        
 app.config['MAIL_DEFAULT_SENDER'] = ("Pyman Ethereum Marketplace", app.config['MAIL_USERNAME'])
+metrics = Metrics(app)   # first, so its request timer wraps every other hook
 mail = Mail(app)
-
-
+mail_queue = MailQueue(app, mail)
+event_indexer = EventIndexer(app)
+facet_cache = FacetCache(app)
+response_cache = ResponseCache(app)
+identities = IdentityCache(app)
+storage = Storage(app)
+image_pipeline = ImagePipeline(app)
+uploads = Uploads(app)
+inventory = Inventory(app)
+
+
+configure_database(app)
 db.init_app(app)
+migrate = Migrate(app, db, render_as_batch=True, include_object=include_object)
 
 manager = LoginManager(app)
 
 
-with app.app_context():
-    db.create_all()
-
-
-BRANDS = ["Acura", "Aston-Martin", "Audi", "Avatr", "Bentley", "BMW", "BYD", "Cadillac", "Chevrolet", "Citroen",
-          "Ford", "GMC", "Honda", "Hyundai", "Infiniti", "Kia", "Land-Rover", "Lexus", "Maybach", "McLaren",
-          "Mercedes-AMG", "Mercedes-Benz", "Mitsubishi", "Nissan", "Peugeot", "Renault", "Rolls-Royce", "Tesla",
-          "Toyota", "Volkswagen"
-        ]
-
 @manager.user_loader
 def load_user(idn):
     return db.get_or_404(User, idn)
@@ -61,25 +81,53 @@ def home():
     
 
 @app.get("/api/get-products")
+@response_cache.cached(lambda: {"products"})
 def get_products():
-    products = Product.query.order_by(Product.created_at.desc()).all()
+    products = Product.query.options(*Product.serialization_options()).order_by(Product.created_at.desc()).all()
     return jsonify([product.to_dict() for product in products])
 
 
+@app.get("/api/products")
+def list_products():
+    try:
+        products, next_cursor = get_page(request.args)
+    except CatalogError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"products": [product.to_dict() for product in products], "next_cursor": next_cursor})
+
+
+@app.get("/api/search")
+def search():
+    try:
+        products = search_products(request.args)
+    except CatalogError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"products": [product.to_dict() for product in products]})
+
+
+@app.get("/api/facets")
+def facets():
+    try:
+        summary = facet_cache.get(request.args)
+    except CatalogError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(summary)
+
+
 @app.route('/api/seller-products/<address>', methods=['GET'])
+@response_cache.cached(lambda address: {f"seller:{address.lower()}"})
 def get_seller_products(address):
-    user = User.query.filter(func.lower(User.address) == address.lower()).first()
-    if not user:
-        abort(404)
+    user = identities.get_or_404(address)
 
-    products = Product.query.filter_by(seller_id=user.id).all()
+    products = Product.query.options(*Product.serialization_options()).filter_by(seller_id=user.id).all()
 
     return jsonify({"seller_name": user.name, "products": [product.to_dict() for product in products]})
 
 
 @app.route('/api/get-product/<slug>', methods=['GET'])
+@response_cache.cached(lambda slug: {f"product:{slug}"})
 def get_product(slug):
-    product = Product.query.filter_by(slug=slug).first_or_404()
+    product = Product.query.options(*Product.serialization_options()).filter_by(slug=slug).first_or_404()
     return jsonify(product.to_dict())
 
 
@@ -92,15 +140,19 @@ def add_product():
     slug = slug.lower().replace(" ", "-") 
     slug = slug + "-" + str(uuid.uuid4())
 
-    address = data.get("address").lower()
-
-    user = User.query.filter_by(address=address).first_or_404()
+    user = identities.get_or_404(data.get("address"))
     if not user.is_seller:
         abort(403)
+    address = user.address
 
     if data.get("brand") not in BRANDS:
         return jsonify({'message': 'Unrecognised brand.'}), 400
 
+    try:
+        price_gwei = eth_to_gwei(data.get('price'))
+    except MoneyError as e:
+        return jsonify({'message': str(e)}), 400
+
     product = Product(
         title=data.get('title'),
         brand=data.get('brand'),
@@ -111,36 +163,98 @@ def add_product():
         vehicle_type=data.get('vehicle_type'),
         year=int(data.get('year')) if data.get('year') else None,
         description=data.get('description'),
-        price=float(data.get('price')),
+        price_gwei=price_gwei,
         mileage=int(data.get('mileage')) if data.get('mileage') else 0,
         seller_id=user.id
     )
 
+    try:
+        image_urls = stored_urls(images, data.getlist('uploads'), address)
+    except UploadError as e:
+        return jsonify({'message': str(e)}), 400
+
     db.session.add(product)
     db.session.flush()  # get product.id before commit
 
-    # Save images
-    for image in images:
-        filename = f"{str(uuid.uuid4())}_{secure_filename(image.filename)}"
-        image_folder = os.path.join(os.path.join(os.getcwd(), 'images', address, product.id))
-        os.makedirs(image_folder, exist_ok=True)
+    base_url = request.host_url.rstrip('/')
+    for url in image_urls:
+        db.session.add(new_image(base_url + url, product.id))
+
+    db.session.commit()
+    return jsonify({'message': 'Product added successfully'}), 201
+
+
+@app.post('/api/products/import')
+def import_products_endpoint():
+    # The file is the raw request body (CSV, JSONL or a zip with images), not a form.
+    address = request.args.get("wallet")
+    if not address:
+        abort(403)
+    user = identities.get_or_404(address)
+    if not user.is_seller:
+        abort(403)
+
+    with tempfile.TemporaryFile() as file:
+        shutil.copyfileobj(request.stream, file)
+        file.seek(0)
+        try:
+            report = import_products(user, file, request.host_url.rstrip('/'))
+        except InventoryError as e:
+            return jsonify({"message": str(e), "errors": e.errors}), 400
+    return jsonify(report), 201
+
 
-        image_path = os.path.join(image_folder, filename)
-        image.save(image_path)
+@app.get('/api/seller-products/<address>/export')
+def export_seller_products(address):
+    user = identities.get_or_404(address)
+    lines = export_products(user.id, app.config["EXPORT_BATCH_SIZE"])
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f"attachment; filename={user.address}.ndjson"})
 
-        base_url = request.host_url.rstrip('/')
-        image_url = f"{base_url}/images/{address}/{product.id}/{filename}"
 
-        img = Image(path=image_url, product_id=product.id)
-        db.session.add(img)
+@app.post('/api/uploads')
+def create_upload():
+    data = request.get_json()
+    user = identities.get_or_404(data.get("address"))
+    if not user.is_seller:
+        abort(403)
+
+    size = data.get("size")
+    if not isinstance(size, int) or not 0 < size <= app.config["UPLOAD_MAX_FILE_SIZE"]:
+        return jsonify({"error": "Size must be between 1 byte and the upload limit."}), 400
 
+    upload = UploadSession(address=user.address, filename=data.get("filename"), size=size)
+    db.session.add(upload)
     db.session.commit()
-    return jsonify({'message': 'Product added successfully'}), 201
+    return jsonify({"upload_id": upload.id, "offset": 0}), 201
+
+
+@app.get('/api/uploads/<upload_id>')
+def get_upload(upload_id):
+    upload = db.get_or_404(UploadSession, upload_id)
+    return jsonify({"upload_id": upload.id, "size": upload.size, "offset": upload_offset(upload), "complete": upload.path is not None})
+
+
+@app.patch('/api/uploads/<upload_id>')
+def upload_chunk(upload_id):
+    upload = db.get_or_404(UploadSession, upload_id)
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        offset = append_chunk(upload, request.stream, offset, app.config["UPLOAD_CHUNK_SIZE"])
+    except (UploadError, ValueError) as e:
+        return jsonify({"error": str(e), "offset": upload_offset(upload)}), 409
+    db.session.commit()
+    return jsonify({"upload_id": upload.id, "offset": offset, "complete": upload.path is not None})
+
+
+@app.route('/images/blobs/<prefix>/<filename>')
+def serve_blob(prefix, filename):
+    return storage.send(f"blobs/{prefix}/{filename}", immutable=True)
 
 
 @app.route('/images/<address>/<product_id>/<filename>')
 def serve_image(address, product_id, filename):
-    return send_from_directory(f'images/{address}/{product_id}', filename)
+    return storage.send(f"{address}/{product_id}/{filename}")
 
 
 
@@ -154,61 +268,55 @@ def edit_product(slug):
     new_images = request.files.getlist('new_images')
     existing_images = request.form.getlist('existing_images')
 
-    address = data.get("address").lower()
-    user = User.query.filter_by(address=address).first_or_404()
+    user = identities.get_or_404(data.get("address"))
     if not user.is_seller:
         abort(403)
+    address = user.address
 
-    if product.seller != user:
+    if product.seller_id != user.id:
         abort(403)
+
+    try:
+        price_gwei = eth_to_gwei(data.get('price')) if data.get('price') else 0
+        image_urls = stored_urls(new_images, data.getlist('uploads'), address)
+    except (MoneyError, UploadError) as e:
+        return jsonify({'error': str(e)}), 400
         
     product.title = data.get('title')
     product.brand = data.get('brand')
     product.model = data.get('model')
     product.year = int(data.get('year')) if data.get('year') else None
-    product.price = float(data.get('price')) if data.get('price') else 0
+    product.price_gwei = price_gwei
     product.mileage = int(data.get('mileage')) if data.get('mileage') else 0
     product.fuel_type = data.get('fuel_type')
     product.transmission = data.get('transmission')
     product.vehicle_type = data.get('vehicle_type')
     product.description = data.get('description')
 
-    # Get images that are being removed
-    images_to_delete = Image.query.filter(
-        Image.product_id == product.id,
-        ~Image.path.in_(existing_images)
-    ).all()
-
-    for img in images_to_delete:
-        try:
-            # Extract actual path on disk
-            filename = img.path.rsplit('/', 1)[-1]
-            file_path = os.path.join(os.getcwd(), 'images', product.id, filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)         
-        except Exception as e:
-            print(f"Failed to delete image file: {e}")
-
-    # Then delete the DB records
+    # Files of removed images are left to the storage sweeper once nothing refers to them.
     Image.query.filter(
         Image.product_id == product.id,
         ~Image.path.in_(existing_images)
     ).delete(synchronize_session=False)
 
-    for img_file in new_images:
-        filename = f"{secure_filename(img_file.filename)}_{uuid.uuid4()}"
-        path = os.path.join(os.getcwd(), 'images', product.id, filename)
-        img_file.save(path)
-        img_url = request.host_url.rstrip('/') + '/images/' + product.id + "/" + filename
-        db.session.add(Image(path=img_url, product_id=product.id))
+    base_url = request.host_url.rstrip('/')
+    for url in image_urls:
+        db.session.add(new_image(base_url + url, product.id))
 
     db.session.commit()
     return jsonify({'message': 'Product updated successfully'})
 
 
 @app.route("/api/get-brands")
+@response_cache.cached(lambda: {"brands"})
 def get_brands():
-    return jsonify({"brands": BRANDS})
+    counts = {facet["value"]: facet["count"] for facet in facet_cache.summary()["brand"]}
+    return jsonify({"brands": BRANDS, "counts": counts})
+
+
+@app.get("/api/cache-stats")
+def cache_stats():
+    return jsonify({**response_cache.stats(), "identities": identities.stats()})
 
 
 @app.route('/api/delete-product/<slug>', methods=['DELETE'])
@@ -219,18 +327,9 @@ def delete_product(slug):
 
     if product.has_transaction: 
         return jsonify({'error': 'Product has transaction.'}), 400
-    # Delete all associated images from DB
+    # Delete all associated images from DB; the storage sweeper removes their files later
     Image.query.filter_by(product_id=product.id).delete()
 
-    # Remove the entire image folder for this product
-    image_dir = os.path.join(os.getcwd(), 'images', product.seller.address, product.id)
-    if os.path.exists(image_dir):
-        try:
-            shutil.rmtree(image_dir)
-        except Exception as e:
-            return jsonify({'message': f"Error deleting image directory: {e}"})
-
-
     # Delete the product record
     db.session.delete(product)
     db.session.commit()
@@ -245,9 +344,7 @@ def logged_status():
 
 @app.route('/api/user-exists/<address>', methods=['GET'])
 def user_exists(address):
-    user = User.query.filter(func.lower(User.address) == address.lower()).first()
-    if not user:
-        abort(404)
+    user = identities.get_or_404(address)
     info = {
         "email": user.email,
         "name": user.name,
@@ -264,7 +361,9 @@ def register_user():
 
     name = data.get('name')
     email = data.get('email').lower()
-    address = data.get('address')
+    address = normalize_address(data.get('address'))
+    if address is None:
+        return jsonify({"status": False, "message": "Invalid wallet address."}), 400
 
     user = User.query.filter_by(email=email).first()
     if user:
@@ -282,9 +381,8 @@ def register_user():
             "address": address
         }
 
-        msg = Message("Pyman Ethereum Marketplace OTP", recipients=[email])
-        msg.html = f"<h1>Your OTP: {otp}</h1><p>Use it to log in. It expires in 5 minutes.</p>"
-        mail.send(msg)
+        enqueue(otp_mail(otp, recipients=[email]))
+        db.session.commit()
     except Exception as e:
         return jsonify({"status": False, "message": str(e)})
     else:
@@ -318,125 +416,17 @@ def verify_otp():
     # Verify OTP
     totp = pyotp.TOTP(secret, interval=300)
     if totp.verify(otp_input):
-        msg = Message(subject="🎉 Signed Up!", recipients=[email])
-        msg.html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Signed Up!</title>
-            <style>
-                body {{
-                    margin: 0;
-                    padding: 0;
-                    background-color: #f9fafb;
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    color: #1f2937;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 40px auto;
-                    background: #ffffff;
-                    padding: 40px;
-                    border-radius: 12px;
-                    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
-                }}
-                .brand {{
-                    display: flex;
-                    align-items: center;
-                    gap: 10px;
-                    margin-bottom: 30px;
-                    font-weight: 700;
-                    font-size: 24px;
-                    color: #1d4ed8;
-                }}
-                .title {{
-                    font-size: 20px;
-                    font-weight: 600;
-                    margin-bottom: 20px;
-                }}
-                .content {{
-                    font-size: 16px;
-                    line-height: 1.6;
-                    margin-bottom: 30px;
-                }}
-                .button {{
-                    display: inline-block;
-                    padding: 12px 20px;
-                    font-size: 16px;
-                    font-weight: 600;
-                    color: #fff;
-                    background-color: #1d4ed8;
-                    border-radius: 8px;
-                    text-decoration: none;
-                }}
-                .button:hover {{
-                    background-color: #1e40af;
-                }}
-                .footer {{
-                    text-align: center;
-                    font-size: 13px;
-                    color: #6b7280;
-                    margin-top: 40px;
-                }}
-                @media (prefers-color-scheme: dark) {{
-                    body {{
-                        background-color: #111827;
-                        color: #f3f4f6;
-                    }}
-                    .container {{
-                        background-color: #1f2937;
-                    }}
-                    .button {{
-                        background-color: #2563eb;
-                    }}
-                    .footer {{
-                        color: #9ca3af;
-                    }}
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="brand">Pyman</div>
-
-                <div class="title">🎉 Welcome to Pyman!</div>
-
-                <div class="content">
-                    <p>Thanks for signing up to <b>Pyman</b>, a multivendor car marketplace built on the Ethereum blockchain.</p>
-                    <p>You can check out our smart contract here:<br>
-                        <a href="{CONTRACT_LINK}" target="_blank">{CONTRACT_LINK}</a>
-                    </p>
-                    <p>If you’re a vendor (or want to become one), you can update your account by clicking below:</p>
-                    <p>
-                        <a href="https://multivendor-ethereum-marketplace.vercel.app/account" 
-                        class="button" target="_blank">
-                        Account Page
-                        </a>
-                    </p>
-                </div>
-
-                <div class="footer">
-                    <p>Pyman &copy; {datetime.now().year}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-        mail.send(msg)
+
         session.clear()
         new_user = User(
             name=name.capitalize(),
             email=email,
-            address=address.lower(),
+            address=address,   # normalized by register_user
         )
         db.session.add(new_user)
+        enqueue(welcome_mail(recipients=[email]))
         db.session.commit()
 
-        folder = os.path.join(os.getcwd(), 'images', new_user.address)
-        os.makedirs(folder, exist_ok=True)
-
         return jsonify({'status': True, 'message': 'OTP verified successfully'}), 200
     else:
         return jsonify({'status': False, 'message': 'Invalid OTP'}), 400
@@ -447,7 +437,7 @@ def update_name():
     data = request.get_json()
     address = data.get("address")
     name = data.get("name")
-    user = User.query.filter(func.lower(User.address) == address.lower()).first()
+    user = identities.user(address)
     if not user:
         abort(404)
     
@@ -461,13 +451,10 @@ def update_name():
 def make_vendor():
     data = request.get_json()
     address = data.get("address")
-    user = User.query.filter(func.lower(User.address) == address.lower()).first()
+    user = identities.user(address)
     if not user:
         abort(404)
 
-    folder = os.path.join(os.getcwd(), 'images', user.address)
-    os.makedirs(folder, exist_ok=True)
-
     user.is_seller = True
     db.session.commit()
     
@@ -479,30 +466,53 @@ def get_wishlists():
     address = request.args.get("wallet")
     if not address:
         abort(403)
-    user = User.query.filter_by(address=address).first_or_404()
+    user = identities.get_or_404(address)
     wishlists = Wishlist.query.filter_by(user_id=user.id).all()
     product_ids = [w.product_id for w in wishlists]
     return jsonify({"wishlists": product_ids}), 200
 
 
+@app.get('/api/wishlist-products')
+def get_wishlist_products():
+    address = request.args.get("wallet")
+    if not address:
+        abort(403)
+    user = identities.lookup(address)
+    products = wishlist_products(user.id) if user else []
+    return jsonify({"products": [product.to_dict() for product in products]}), 200
+
+
+def _invalidate_wishlisted(products):
+    # The counters are bumped with a bulk UPDATE, which the response cache can't see, so every
+    # cached response that shows them is invalidated here: the product, its seller's page and the listing.
+    tags = {"products"} if products else set()
+    for slug, seller_address in products:
+        tags.update((f"product:{slug}", f"seller:{seller_address}"))
+    response_cache.invalidate(*tags)
+
+
 @app.post('/api/add-wishlist')
 def add_wishlist():
     address = request.args.get("wallet")
     if not address:
         abort(403)
-    user = User.query.filter_by(address=address).first_or_404()
+    user = identities.get_or_404(address)
 
     data = request.get_json()
-    product_id = data.get('product_id')
-
-    # Prevent duplicate wishlist entries
-    exists = Wishlist.query.filter_by(user_id=user.id, product_id=product_id).first()
-    if exists:
-        return jsonify({"message": "Already wishlisted"}), 200
+    try:
+        product_ids = product_ids_from(data)
+    except WishlistError as e:
+        return jsonify({'message': str(e)}), 400
 
-    wishlist_item = Wishlist(user_id=user.id, product_id=product_id)
-    db.session.add(wishlist_item)
+    added, products = add_products(user.id, product_ids)
     db.session.commit()
+    _invalidate_wishlisted(products)
+
+    if "product_ids" in data:
+        return jsonify({"added": added}), 201 if added else 200
+    if not added:
+        db.get_or_404(Product, product_ids[0])
+        return jsonify({"message": "Already wishlisted"}), 200
     return jsonify({"message": "Added"}), 201
 
 
@@ -511,13 +521,20 @@ def remove_wishlist():
     address = request.args.get("wallet")
     if not address:
         abort(403)
-    user = User.query.filter_by(address=address).first_or_404()
+    user = identities.get_or_404(address)
 
     data = request.get_json()
-    product_id = data.get('product_id')
+    try:
+        product_ids = product_ids_from(data)
+    except WishlistError as e:
+        return jsonify({'message': str(e)}), 400
 
-    Wishlist.query.filter_by(user_id=user.id, product_id=product_id).delete()
+    removed, products = remove_products(user.id, product_ids)
     db.session.commit()
+    _invalidate_wishlisted(products)
+
+    if "product_ids" in data:
+        return jsonify({"removed": removed}), 200
     return '', 204
 
 
@@ -525,49 +542,33 @@ def remove_wishlist():
 def create_transaction():
     data = request.get_json()
     transaction_id = data.get('transaction_id')
-    seller_addr = data.get('seller').lower()
-    buyer_addr = data.get('buyer').lower()
-    amount = data.get('amount')
     product_id = data.get('product_id')
+    try:
+        # amount_wei is exact; amount (ETH, as formatted by the client) is still accepted.
+        amount_gwei = wei_to_gwei(data['amount_wei']) if 'amount_wei' in data else eth_to_gwei(data.get('amount'))
+    except MoneyError as e:
+        return jsonify({'message': str(e)}), 400
 
     product = Product.query.filter_by(id=product_id).first_or_404()
+    buyer = identities.get_or_404(data.get('buyer'))
+    seller = identities.get_or_404(data.get('seller'))
 
     new_transaction = Transaction(
         transaction_id=transaction_id,
-        seller=seller_addr,
-        buyer=buyer_addr,
-        amount=amount,
-        product_id=product_id
+        seller_id=seller.id,
+        buyer_id=buyer.id,
+        amount_gwei=amount_gwei,
+        product_id=product.id
     )
     
     db.session.add(new_transaction)
     if not product.has_transaction:
         product.has_transaction = True
-    
-    buyer = User.query.filter_by(address=buyer_addr).first()
-    seller = User.query.filter_by(address=seller_addr).first()
-
-    title = f"Transaction {transaction_id} has been initialized!"
-    content_seller = f"""
-    Dear {seller.name.split(" ")[0]},<br>
-    A potential buyer has created a transaction and paid (Transaction {transaction_id}) for the product details below.
-    <br><br>Kindly deliver the product to them.
-    """
-
-    content_buyer = f"""
-    Dear {buyer.name.split(" ")[0]},<br>
-    Thanks for your order!<br><br> The seller will proceed to deliver the product to you.
-    """    
-
-    msg_buyer = send_transaction_mail(title=title, content=content_buyer, recipients=[buyer.email], product=product)
-    msg_seller = send_transaction_mail(title=title, content=content_seller, recipients=[seller.email], product=product)
-    try:
-        mail.send(msg_buyer)
-        mail.send(msg_seller)
-    except Exception as e:
-        return jsonify({"Message": str(e)}), 500
-    else:
-        db.session.commit()
+
+    msg_buyer, msg_seller = transaction_mails(transaction_id, product, buyer, seller)
+    enqueue(msg_buyer)
+    enqueue(msg_seller)
+    db.session.commit()
 
     return jsonify({"message": "Added Transaction."}), 201
 
@@ -580,90 +581,19 @@ def update_transaction():
 
     transaction = Transaction.query.filter_by(transaction_id=transaction_id).first_or_404()
 
+    # The event indexer may already have applied (and announced) this status.
+    if transaction.status == status:
+        return jsonify({"message": "Transaction updated successfully.", "new_status": transaction.status}), 201
+
     transaction.status = status
 
     product = transaction.product
 
-    buyer = User.query.filter_by(address=transaction.buyer).first()
-    seller = User.query.filter_by(address=transaction.seller).first()
-
-    if status == 1:
-        title = f"Seller has delivered product in transaction {transaction_id}"
-        content_seller = f"""
-        Dear {seller.name.split(" ")[0]},<br><br>
-        You have marked the transaction with ID: {transaction_id} as delivered.<br>
-        We are now waiting for the buyer to confirm the delivery, and then you'll be able to claim your funds.
-        """
-
-        content_buyer = f"""
-        Dear {buyer.name.split(" ")[0]},<br><br>
-        The seller in the transaction with ID: {transaction_id} has marked it as delivered.<br>
-        Please confirm the delivery when you receive it. If you are not satisfied with the product, you can raise a dispute later.
-        """
-    elif status == 2:
-        title = f"Buyer has confirmed receiving product in transaction {transaction_id}"
-        content_buyer = f"""
-        Dear {buyer.name.split(" ")[0]},<br><br>
-        You have marked the transaction with ID: {transaction_id} as confirmed, meaning you have received the product.<br>
-        You can raise a dispute within the next 24 hrs if you happen to be dissatisfied with the product.
-        """
-
-        content_seller = f"""
-        Dear {seller.name.split(" ")[0]},<br><br>
-        The buyer in the transaction with ID: {transaction_id} has confirmed that they have received the product.<br>
-        Barring them raising a dispute on the transaction, you will be able to claim your funds in the next 24 hrs.
-        """
-    elif status == 3:
-        title = f"Buyer has raied a dispute on transaction {transaction_id}"
-        content_buyer = f"""
-        Dear {buyer.name.split(" ")[0]},<br><br>
-        You have just disputed the transaction with ID: {transaction_id}.<br>
-        You should proceed to returning the product back to the seller. When they confirm the return, we will immediately refund your funds.
-        """
-
-        content_seller = f"""
-        Dear {seller.name.split(" ")[0]},<br><br>
-        The buyer in the transaction with ID: {transaction_id} has raised a dispute and will return your product to you.<br>
-        When they do that, you should let us know immediately so we can refund their funds to them.
-        """
-    elif status == 4:
-        title = f"Transaction {transaction_id} cancelled!"
-        content_seller = f"""
-        Dear {seller.name.split(" ")[0]},<br><br>
-        You have confirmed the return of the product in transaction with ID: {transaction_id} and the transaction has been cancelled and finalized.
-        """
-
-        content_buyer = f"""
-        Dear {buyer.name.split(" ")[0]},<br><br>
-        The seller in the transaction with ID: {transaction_id} has confirmed the return of their product.<br>
-        Your funds have been refunded and the transaction has been cancelled and finalized. Thank you.
-        """
-    elif status == 5:
-        title = f"Transaction {transaction_id} successful and finalized."
-        content_seller = f"""
-        Dear {seller.name.split(" ")[0]},<br><br>
-        You have successfully claimed your funds in transaction with ID: {transaction_id} and the transaction has been successfully finalized.<br><br>
-        Thank you!
-        """
-
-        content_buyer = f"""
-        Dear {buyer.name.split(" ")[0]},\n
-        The seller in the transaction with ID: {transaction_id} and the transaction has been successfully finalized.<br><br>
-        Thank you!
-        """
-
-    msg_buyer = send_transaction_mail(title=title, content=content_buyer, recipients=[buyer.email], product=product)
-    msg_seller = send_transaction_mail(title=title, content=content_seller, recipients=[seller.email], product=product)
-
-    try:
-        mail.send(msg_buyer)
-        mail.send(msg_seller)
-    except Exception as e:
-        return jsonify({"message": str(e)}), 500
-    else:
-        db.session.commit()
+    msg_buyer, msg_seller = transaction_mails(transaction_id, product, transaction.buyer, transaction.seller, status=status)
+    enqueue(msg_buyer)
+    enqueue(msg_seller)
+    db.session.commit()
 
-    print({"message": "Transaction updated successfully.", "new_status": transaction.status})
     return jsonify({"message": "Transaction updated successfully.", "new_status": transaction.status}), 201
 
 
@@ -673,14 +603,80 @@ def get_transactions():
     if not address:
         abort(403)
     
-    address = address.lower()
+    user = identities.lookup(address)
+    if not user:
+        return jsonify({"buyer": [], "seller": []}), 200
 
-    buyer = Transaction.query.filter_by(buyer=address).all()
-    seller = Transaction.query.filter_by(seller=address).all()
-    # print({"buyer": [b.to_dict() for b in buyer], "seller": [s.to_dict() for s in seller]})
+    options = Transaction.serialization_options()
+    buyer = Transaction.query.options(*options).filter_by(buyer_id=user.id).all()
+    seller = Transaction.query.options(*options).filter_by(seller_id=user.id).all()
     return jsonify({"buyer": [b.to_dict() for b in buyer], "seller": [s.to_dict() for s in seller]}), 200
 
 
+@app.get('/api/transactions')
+def list_transactions():
+    address = request.args.get("wallet")
+    if not address:
+        abort(403)
+
+    user = identities.lookup(address)
+    if not user:
+        return jsonify({"transactions": [], "next_cursor": None}), 200
+    try:
+        transactions, next_cursor = get_transaction_page(user, request.args)
+    except HistoryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"transactions": [t.to_dict() for t in transactions], "next_cursor": next_cursor}), 200
+
+
+@app.get('/api/transactions/summary')
+def transactions_summary():
+    address = request.args.get("wallet")
+    if not address:
+        abort(403)
+
+    user = identities.get_or_404(address)
+    try:
+        return jsonify(transaction_summary(user, request.args)), 200
+    except HistoryError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.post('/api/admin/reconcile-transactions')
+def reconcile_transactions_endpoint():
+    data = request.get_json()
+    address = data.get("address")
+    if not address:
+        abort(403)
+    user = identities.get_or_404(address)
+    if not user.is_admin:
+        abort(403)
+
+    workers = data.get("workers", 8)
+    if not isinstance(workers, int) or isinstance(workers, bool) or not 1 <= workers <= MAX_WORKERS:
+        return jsonify({"error": f"workers must be a whole number from 1 to {MAX_WORKERS}."}), 400
+    dry_run = data.get("dry_run", False)
+    if not isinstance(dry_run, bool):
+        return jsonify({"error": "dry_run must be true or false."}), 400
+
+    try:
+        report = reconcile_transactions(workers=workers, dry_run=dry_run)
+    except RPC_ERRORS as e:
+        return jsonify({"error": str(e)}), 502
+    return jsonify(report), 200
+
+
+@app.cli.command("reconcile-transactions")
+@click.option("--workers", default=8, show_default=True, type=click.IntRange(1, MAX_WORKERS),
+              help="JSON-RPC batches in flight at once.")
+@click.option("--dry-run", is_flag=True, help="Report the drift without writing corrections.")
+def reconcile_transactions_command(workers, dry_run):
+    """Correct transaction statuses that have drifted from the contract."""
+    report = reconcile_transactions(workers=workers, dry_run=dry_run)
+    for key, value in report.items():
+        click.echo(f"{key}: {value}")
+
+
 @app.post('/api/contact')
 def contact():
     data = request.get_json()
@@ -690,25 +686,15 @@ def contact():
     subject = data.get("subject")
     email = data.get("email")
 
-    content = f"""
-    Name: {name} <br>
-    Email: {email} <br>
-    {"Phone: " + phone + "<br>" if phone else ""}
-    <br><br>
-    {message}
-    """
-    
     if subject:
         pass
     else:
         subject = "Message from Contact Page"
-    msg = send_contact_email(title=subject, recipients=[app.config['MAIL_USERNAME']], content=content)
-    try:
-        mail.send(msg)
-    except Exception as e:
-        return jsonify({"Message": str(e)}), 500
-    else:
-        return jsonify({"message": "Message sent successfully!"})
+    msg = contact_mail(title=subject, recipients=[app.config['MAIL_USERNAME']],
+                       name=name, email=email, phone=phone, message=message)
+    enqueue(msg)
+    db.session.commit()
+    return jsonify({"message": "Message sent successfully!"})
 
 
 @app.post("/api/balance-and-autowithdraw")
@@ -727,7 +713,6 @@ def balance_and_autowithdrawStatus():
         else:
             return jsonify({"error": response["error"]}), response["code"]
 
-    print("Successfull autowu")
     return jsonify(response), 200 
         
 
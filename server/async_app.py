@@ -0,0 +1,105 @@
+"""An asyncio server for the API routes that spend their time waiting on the network.
+
+The Flask app ties up a whole worker while an Alchemy call is in flight; here one process waits
+on hundreds of them. It serves the same URLs and responses as app.py, so a proxy can route these
+paths to it and everything else to the Flask workers:
+
+    python async_app.py                                                        (port 3052)
+    gunicorn async_app:create_app --worker-class aiohttp.GunicornWebWorker
+
+Database access goes through SQLAlchemy's asyncio extension, which needs aiosqlite for SQLite
+(psycopg for PostgreSQL). Mail needs nothing here: every route queues it in the outbox and the
+mail workers send it (see mail_queue.py).
+"""
+import json
+import os
+from datetime import datetime
+
+from aiohttp import web
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from werkzeug.http import http_date
+
+from contract import get_balance_and_autowithdrawStatus_async
+from database import create_async_engine
+from identity import normalize_address
+from models import User, Transaction
+
+load_dotenv()
+
+routes = web.RouteTableDef()
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+
+def _default(value):
+    # Same datetime format as Flask's jsonify.
+    if isinstance(value, datetime):
+        return http_date(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=lambda obj: json.dumps(obj, default=_default))
+
+
+@routes.post("/api/balance-and-autowithdraw")
+async def balance_and_autowithdrawStatus(request):
+    data = await request.json()
+    address = data.get("address")
+
+    if not address:
+        return json_response({"error": "Address required."}, 400)
+
+    success, response = await get_balance_and_autowithdrawStatus_async(address=address)
+    if not success:
+        if "getaddrinfo failed" in response["error"]:
+            return json_response({"error": "Failed to connect."}, response["code"])
+        return json_response({"error": response["error"]}, response["code"])
+    return json_response(response)
+
+
+@routes.get("/api/get-transactions")
+async def get_transactions(request):
+    address = request.query.get("wallet")
+    if not address:
+        raise web.HTTPForbidden()
+
+    address = normalize_address(address)
+    async with request.app["db_session"]() as session:
+        user = address and await session.scalar(select(User).filter_by(address=address))
+        if not user:
+            return json_response({"buyer": [], "seller": []})
+
+        query = select(Transaction).options(*Transaction.serialization_options())
+        buyer = (await session.scalars(query.filter_by(buyer_id=user.id))).unique().all()
+        seller = (await session.scalars(query.filter_by(seller_id=user.id))).unique().all()
+        return json_response({"buyer": [b.to_dict() for b in buyer], "seller": [s.to_dict() for s in seller]})
+
+
+def database_url():
+    url = make_url(os.getenv("DATABASE_URL", "sqlite:///cars.db"))
+    # Flask-SQLAlchemy keeps relative SQLite paths in the instance folder; open the same file.
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") \
+            and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(INSTANCE_PATH, url.database))
+    return url.render_as_string(hide_password=False)
+
+
+async def _database(app):
+    engine = create_async_engine(database_url())
+    app["db_session"] = async_sessionmaker(engine, expire_on_commit=False)
+    yield
+    await engine.dispose()
+
+
+def create_app():
+    app = web.Application()
+    app.add_routes(routes)
+    app.cleanup_ctx.append(_database)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=int(os.getenv("PORT", 3052)))
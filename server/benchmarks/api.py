@@ -0,0 +1,285 @@
+"""Latency, throughput and SQL queries per request for the main API endpoints, on seeded data.
+
+Run from the server folder:  python -m benchmarks.api [options]   (--help lists them)
+
+Everything runs in this process against a scratch SQLite database (or BENCH_DATABASE_URL) and
+offline: mail goes through the outbox workers as usual but is never handed to an SMTP server, and
+RPC calls go to a local stand-in node (benchmarks/fake_rpc.py). Requests are made from
+--concurrency threads through the Flask test client, so the numbers are the app's own, without
+an HTTP server in front.
+
+To gate regressions, save a run with --save baseline.json and check later runs with
+--compare baseline.json: the exit status is 1 if any endpoint's p95 grew by more than
+--tolerance, or if it makes more SQL queries per request than before.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks.fake_rpc import FakeRPC
+
+_local = threading.local()   # SQL statements run by the current request thread
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _local.queries = getattr(_local, "queries", 0) + 1
+
+
+def seed(users, products, images, wishlists, transactions):
+    """Bulk-insert a marketplace; a fifth of the users are sellers. Returns what the scenarios pick from."""
+    from models import db, User, Product, Image, Wishlist, Transaction
+    from catalog import BRANDS
+
+    rng = random.Random(0)   # the same data on every run
+    now = datetime.now(timezone.utc)
+    user_rows = [{
+        "id": i + 1, "email": f"user{i}@example.com", "name": f"User {i}", "address": f"0x{i + 1:040x}",
+        "is_seller": i % 5 == 0,
+    } for i in range(users)]
+    sellers = [row for row in user_rows if row["is_seller"]]
+    db.session.execute(db.insert(User), user_rows)
+
+    product_rows = [{
+        "id": str(uuid.uuid4()), "title": f"Car {i}", "brand": rng.choice(BRANDS), "model": "Model",
+        "slug": f"car-{i}", "fuel_type": "Petrol", "transmission": "Automatic", "vehicle_type": "Sedan",
+        "year": rng.randint(2000, 2025), "description": "A well kept car. " * 20,
+        "price_gwei": rng.randint(1, 100) * 10**8, "mileage": rng.randint(0, 200_000), "has_transaction": False,
+        "seller_id": rng.choice(sellers)["id"], "created_at": now - timedelta(minutes=i),
+    } for i in range(products)]
+    pairs = {(user["id"], rng.choice(product_rows)["id"]) for user in user_rows for _ in range(wishlists)}
+    saved = Counter(product_id for _, product_id in pairs)
+    for product in product_rows:
+        product["wishlist_count"] = saved[product["id"]]
+    db.session.execute(db.insert(Product), product_rows)
+
+    image_rows = []
+    for product in product_rows:
+        for n in range(images):
+            key = uuid.uuid4().hex
+            image_rows.append({
+                "id": str(uuid.uuid4()), "product_id": product["id"], "width": 4000, "height": 3000,
+                "path": f"http://localhost/images/blobs/{key[:2]}/{key}.jpg",
+                "variants": [{"name": name, "format": fmt, "width": edge, "height": edge * 3 // 4,
+                              "file": f"{key}.jpg.{name}.{fmt}"}
+                             for name, edge in (("detail", 1600), ("card", 640), ("thumb", 240))
+                             for fmt in ("webp", "jpeg")],
+            })
+    db.session.execute(db.insert(Image), image_rows)
+
+    db.session.execute(db.insert(Wishlist), [{"user_id": u, "product_id": p, "created_at": now} for u, p in pairs])
+
+    transaction_rows = []
+    for i in range(transactions):
+        product = rng.choice(product_rows)
+        transaction_rows.append({
+            "transaction_id": i + 1, "product_id": product["id"], "seller_id": product["seller_id"],
+            "buyer_id": rng.choice(user_rows)["id"], "amount_gwei": product["price_gwei"],
+            "status": rng.randrange(6), "created_at": now - timedelta(minutes=i),
+        })
+        product["has_transaction"] = True
+    db.session.execute(db.insert(Transaction), transaction_rows)
+    db.session.commit()
+
+    return {
+        "addresses": [row["address"] for row in user_rows],
+        "sellers": [row["address"] for row in sellers],
+        "slugs": [row["slug"] for row in product_rows],
+        "product_ids": [row["id"] for row in product_rows],
+    }
+
+
+def _photo():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((800, 600)).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+PHOTO = None
+
+
+def add_product(client, data, rng):
+    return client.post("/api/add-product", content_type="multipart/form-data", data={
+        "title": "Bench Car", "brand": "Toyota", "model": "Corolla", "fuel_type": "Petrol",
+        "transmission": "Automatic", "vehicle_type": "Sedan", "year": "2020", "description": "Benchmark listing.",
+        "price": "1.5", "mileage": "1000", "address": rng.choice(data["sellers"]),
+        "images": [(io.BytesIO(PHOTO), "car.jpg", "image/jpeg")],
+    })
+
+
+# name -> (share of the requests, request). Each request gets the test client, the seeded data and a Random.
+SCENARIOS = {
+    "get-products": (0.05, lambda client, data, rng: client.get("/api/get-products")),
+    "get-product": (0.35, lambda client, data, rng: client.get(f"/api/get-product/{rng.choice(data['slugs'])}")),
+    "get-transactions": (0.05, lambda client, data, rng: client.get(
+        "/api/get-transactions", query_string={"wallet": rng.choice(data["addresses"])})),
+    "transactions": (0.05, lambda client, data, rng: client.get(
+        "/api/transactions", query_string={"wallet": rng.choice(data["addresses"]), "role": rng.choice(["buyer", "seller"])})),
+    "transactions-summary": (0.05, lambda client, data, rng: client.get(
+        "/api/transactions/summary", query_string={"wallet": rng.choice(data["sellers"])})),
+    "wishlists": (0.1, lambda client, data, rng: client.get(
+        "/api/wishlists", query_string={"wallet": rng.choice(data["addresses"])})),
+    "wishlist-products": (0.1, lambda client, data, rng: client.get(
+        "/api/wishlist-products", query_string={"wallet": rng.choice(data["addresses"])})),
+    "add-wishlist": (0.1, lambda client, data, rng: client.post(
+        "/api/add-wishlist", query_string={"wallet": rng.choice(data["addresses"])},
+        json={"product_id": rng.choice(data["product_ids"])})),
+    "add-product": (0.05, add_product),
+    "balance": (0.1, lambda client, data, rng: client.post(
+        "/api/balance-and-autowithdraw", json={"address": f"0x{rng.getrandbits(160):040x}"})),
+}
+
+
+def drive(app, data, scenarios, concurrency, seconds):
+    """Run the scenarios from ``concurrency`` threads for ``seconds``; returns {name: [(seconds, queries, status)]}."""
+    names = list(scenarios)
+    weights = [SCENARIOS[name][0] for name in names]
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    start = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def client_thread(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        mine = []
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            name = rng.choices(names, weights)[0]
+            _local.queries = 0
+            started = time.perf_counter()
+            response = SCENARIOS[name][1](client, data, rng)
+            mine.append((name, time.perf_counter() - started, _local.queries, response.status_code))
+        with lock:
+            for name, *sample in mine:
+                samples[name].append(tuple(sample))
+
+    threads = [threading.Thread(target=client_thread, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + seconds
+    started = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    results = {}
+    for name, rows in samples.items():
+        if not rows:
+            continue
+        latencies = sorted(seconds * 1000 for seconds, _, _ in rows)
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        results[name] = {
+            "requests": len(rows),
+            "throughput": len(rows) / elapsed,
+            "p50": cuts[49], "p95": cuts[94], "p99": cuts[98],
+            "queries": statistics.fmean(queries for _, queries, _ in rows),
+            "errors": sum(status >= 400 for _, _, status in rows),
+        }
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, before in baseline["results"].items():
+        after = results.get(name)
+        if after is None:
+            continue
+        if after["p95"] > before["p95"] * (1 + tolerance):
+            found.append(f"{name}: p95 {before['p95']:.1f} ms -> {after['p95']:.1f} ms")
+        if after["queries"] > before["queries"] + 0.05:
+            found.append(f"{name}: {before['queries']:.2f} -> {after['queries']:.2f} queries per request")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.api", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=3, help="per product")
+    parser.add_argument("--wishlists", type=int, default=5, help="per user")
+    parser.add_argument("--transactions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--endpoints", help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="fail on regressions against a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth (default 0.25)")
+    args = parser.parse_args(argv)
+
+    scenarios = args.endpoints.split(",") if args.endpoints else list(SCENARIOS)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    global PHOTO
+    PHOTO = _photo()
+    scratch = tempfile.mkdtemp()
+    rpc = FakeRPC(port=0, delay=0.05).start()
+    os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ["RPC_URL"] = rpc.url
+    os.environ["STORAGE_ROOT"] = os.path.join(scratch, "images")
+    try:
+        from app import app, mail
+        from flask_migrate import upgrade
+        from models import db
+
+        app.logger.disabled = True   # failed requests are counted, not logged
+        app.config["STORAGE_SWEEP_AUTOSTART"] = False
+        app.config["RESPONSE_CACHE_ENABLED"] = args.cache
+        mail.state.suppress = True   # the outbox workers run, but nothing is handed to SMTP
+
+        with app.app_context():
+            upgrade()
+            data = seed(args.users, args.products, args.images, args.wishlists, args.transactions)
+            db.session.remove()
+
+        print(f"{args.users} users, {args.products} products x {args.images} images, "
+              f"{args.transactions} transactions; {args.concurrency} threads for {args.seconds:g}s")
+        samples, elapsed = drive(app, data, scenarios, args.concurrency, args.seconds)
+        results = summarize(samples, elapsed)
+
+        print(f"{'endpoint':>20} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'queries':>8} {'errors':>7}")
+        for name, r in results.items():
+            print(f"{name:>20} {r['requests']:9d} {r['throughput']:8.1f} {r['p50']:8.1f} {r['p95']:8.1f} "
+                  f"{r['p99']:8.1f} {r['queries']:8.2f} {r['errors']:7d}")
+        total = sum(r["requests"] for r in results.values())
+        print(f"{'total':>20} {total:9d} {total / elapsed:8.1f}")
+
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump({"options": vars(args), "results": results}, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                found = regressions(results, json.load(f), args.tolerance)
+            for line in found:
+                print(f"REGRESSION {line}")
+            return 1 if found else 0
+        return 0
+    finally:
+        rpc.shutdown()
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
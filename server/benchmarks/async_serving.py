@@ -0,0 +1,118 @@
+"""Requests per second and requests served at once for /api/balance-and-autowithdraw, one Flask worker
+against one async_app.py process, with every RPC call taking RPC_DELAY seconds.
+
+Run from the server folder:  python -m benchmarks.async_serving [seconds] [max_concurrency]
+
+Both servers talk to a local stand-in node (benchmarks/fake_rpc.py), and every request asks for a
+different address so the balance cache never answers. Needs aiosqlite for the async app.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_rpc import FakeRPC
+
+RPC_DELAY = 0.1
+SYNC_PORT, ASYNC_PORT, RPC_PORT = 3061, 3062, 8545
+_addresses = (f"0x{n:040x}" for n in itertools.count(1))   # never repeated, across runs too
+
+
+def serve_sync(url, rpc_url):
+    os.environ.update(DATABASE_URL=url, RPC_URL=rpc_url)
+    import logging
+    from app import app
+    logging.getLogger("werkzeug").disabled = True
+    app.config["MAIL_QUEUE_AUTOSTART"] = False
+    app.config["STORAGE_SWEEP_AUTOSTART"] = False
+    app.run(port=SYNC_PORT, threaded=False)   # one request at a time, like a sync gunicorn worker
+
+
+def serve_async(url, rpc_url):
+    os.environ.update(DATABASE_URL=url, RPC_URL=rpc_url)
+    from aiohttp import web
+    from async_app import create_app
+    web.run_app(create_app(), port=ASYNC_PORT, print=None, access_log=None, backlog=1024)
+
+
+async def load(port, concurrency, seconds):
+    import aiohttp
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            address = next(_addresses)
+            started = time.perf_counter()
+            try:
+                async with session.post(f"http://127.0.0.1:{port}/api/balance-and-autowithdraw",
+                                        json={"address": address}) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=seconds + 30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors
+
+
+async def wait_for(port):
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Nothing is listening on port {port}.")
+
+
+def main(seconds=5, max_concurrency=200):
+    scratch = tempfile.mkdtemp()
+    url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    rpc = FakeRPC(port=RPC_PORT, delay=RPC_DELAY).start()
+    context = multiprocessing.get_context("spawn")
+    servers = {
+        "flask": (context.Process(target=serve_sync, args=(url, rpc.url), daemon=True), SYNC_PORT),
+        "async": (context.Process(target=serve_async, args=(url, rpc.url), daemon=True), ASYNC_PORT),
+    }
+    try:
+        for process, port in servers.values():
+            process.start()
+            asyncio.run(wait_for(port))
+
+        print(f"RPC round trip {RPC_DELAY * 1000:.0f} ms, {seconds}s per run, one worker each")
+        for concurrency in (n for n in (1, 10, 50, 100, 200, 500) if n <= max_concurrency):
+            for name, (_, port) in servers.items():
+                rate, latencies, errors = asyncio.run(load(port, concurrency, seconds))
+                # Every request waits RPC_DELAY on the node, so this many were being served at once.
+                in_flight = rate * RPC_DELAY
+                p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0
+                print(f"{concurrency:4d} clients, {name}: {rate:7.1f} req/s, {in_flight:6.1f} in flight, "
+                      f"p95 {p95:7.0f} ms, {errors} errors")
+    finally:
+        for process, _ in servers.values():
+            process.terminate()
+            process.join()
+        rpc.shutdown()
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,130 @@
+"""Read and write throughput of the API as the number of worker processes grows.
+
+Run from the server folder:  python -m benchmarks.db_concurrency [seconds] [max_workers]
+
+Each worker is a separate process with its own app and connection pool, like a gunicorn worker.
+A fifth of the requests are create-transaction writes, the rest get-product reads. By default it
+runs against a scratch SQLite file, once with SQLite's defaults and once with SQLITE_PRAGMAS;
+set BENCH_DATABASE_URL to an empty PostgreSQL database to measure that instead.
+"""
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+LISTINGS = 1000
+WRITE_SHARE = 0.2
+
+
+def seed():
+    from models import db, User, Product
+
+    seller = User(email="seller@example.com", name="Bench Seller", address="0x" + "5e" * 20, is_seller=True)
+    buyer = User(email="buyer@example.com", name="Bench Buyer", address="0x" + "b0" * 20)
+    db.session.add_all([seller, buyer])
+    db.session.flush()
+    rows = [{
+        "id": str(uuid.uuid4()), "title": f"Car {i}", "brand": "Toyota", "model": "Corolla", "slug": f"bench-{i}",
+        "year": 2020, "price_gwei": 1_500_000_000, "mileage": 1000, "has_transaction": False, "seller_id": seller.id,
+    } for i in range(LISTINGS)]
+    db.session.execute(db.insert(Product), rows)
+    db.session.commit()
+    return [row["id"] for row in rows], seller.address, buyer.address
+
+
+def worker(url, tuned, product_ids, seller, buyer, start_at, seconds, results):
+    os.environ["DATABASE_URL"] = url
+    from app import app
+    app.logger.disabled = True   # failed requests are counted, not logged
+    app.config["MAIL_QUEUE_AUTOSTART"] = False
+    app.config["STORAGE_SWEEP_AUTOSTART"] = False
+    app.config["RESPONSE_CACHE_ENABLED"] = False   # measure the database, not the cache
+    if not tuned:
+        app.config["SQLITE_PRAGMAS"] = {}
+    client = app.test_client()
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if random.random() < WRITE_SHARE:
+            response = client.post("/api/create-transaction", json={
+                "transaction_id": random.randint(1, 10**9), "seller": seller, "buyer": buyer,
+                "amount": 1.5, "product_id": random.choice(product_ids),
+            })
+            kind = "writes"
+        else:
+            response = client.get(f"/api/get-product/bench-{random.randrange(LISTINGS)}")
+            kind = "reads"
+        counts[kind if response.status_code < 400 else "errors"] += 1
+    results.put(counts)
+
+
+def run(url, tuned, workers, seconds, data):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + 3   # give every process time to import the app
+    processes = [context.Process(target=worker, args=(url, tuned, *data, start_at, seconds, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    totals = {"reads": 0, "writes": 0, "errors": 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    return {key: value / seconds for key, value in totals.items()}
+
+
+def prepare(url):
+    os.environ["DATABASE_URL"] = url
+    from app import app
+    from flask_migrate import upgrade
+    from models import db
+    with app.app_context():
+        upgrade()
+        data = seed()
+        db.session.remove()
+        db.engine.dispose()
+    return data
+
+
+def set_journal_mode(url, mode):
+    # journal_mode is stored in the database file and can only be changed while nobody else has it open.
+    import sqlite3
+    from sqlalchemy.engine import make_url
+    connection = sqlite3.connect(make_url(url).database)
+    connection.execute(f"PRAGMA journal_mode = {mode}")
+    connection.close()
+
+
+def main(seconds=10, max_workers=8):
+    scratch = tempfile.mkdtemp()
+    try:
+        url = os.getenv("BENCH_DATABASE_URL")
+        variants = [("tuned", True)]
+        if url is None:
+            url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+            variants.insert(0, ("sqlite defaults", False))
+        data = prepare(url)
+
+        counts = [n for n in (1, 2, 4, 8, 16) if n <= max_workers]
+        print(f"{url.split(':', 1)[0]}, {seconds}s per run, {WRITE_SHARE:.0%} writes")
+        for label, tuned in variants:
+            if url.startswith("sqlite"):
+                set_journal_mode(url, "wal" if tuned else "delete")
+            for workers in counts:
+                rates = run(url, tuned, workers, seconds, data)
+                print(f"{label:>16}, {workers:2d} workers: {rates['reads']:7.0f} reads/s "
+                      f"{rates['writes']:6.0f} writes/s {rates['errors']:6.1f} errors/s")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,63 @@
+"""A stand-in Ethereum JSON-RPC node for benchmarks: answers the calls contract.py makes after a fixed delay.
+
+Every address has a 2 ETH balance with auto-withdraw on. Point RPC_URL at it before importing
+contract (or the apps), e.g. RPC_URL=http://127.0.0.1:8545.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BALANCE_OF = "0x70a08231"   # balanceOf(address) selector
+
+
+class FakeRPC(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=8545, delay=0.1, block=1000):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.delay = delay
+        self.block = block
+        self.calls = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def answer(self, call):
+        self.calls += 1
+        method = call["method"]
+        if method == "eth_blockNumber":
+            result = hex(self.block)
+        elif method == "eth_chainId":
+            result = hex(11155111)
+        elif method == "eth_call":
+            value = 2 * 10**18 if call["params"][0]["data"].startswith(BALANCE_OF) else 1
+            result = "0x" + f"{value:064x}"
+        else:
+            return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32601, "message": f"{method} not supported"}}
+        return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.delay)   # network and node latency
+        if isinstance(body, list):
+            response = [self.server.answer(call) for call in body]
+        else:
+            response = self.server.answer(body)
+        payload = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
@@ -0,0 +1,49 @@
+"""Requests/s for image URLs served by Flask itself versus handed off with X-Accel-Redirect.
+
+Run from the server folder:  python -m benchmarks.image_serving [requests]
+The offload numbers are Flask's share of the work only; the proxy then streams the file with sendfile().
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def run(client, url, count, headers=None):
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(url, headers=headers)
+        response.get_data()
+    return count / (time.perf_counter() - started), response
+
+
+def main(count=2000):
+    scratch = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ["STORAGE_ROOT"] = os.path.join(scratch, "images")
+    from app import app
+    app.config["MAIL_QUEUE_AUTOSTART"] = False   # the scratch database has no tables
+
+    folder = os.path.join(os.environ["STORAGE_ROOT"], "blobs", "be")
+    os.makedirs(folder, exist_ok=True)
+    name = "be" + "0" * 62 + ".jpg"
+    with open(os.path.join(folder, name), "wb") as f:
+        f.write(os.urandom(250 * 1024))
+
+    url = f"/images/blobs/be/{name}"
+    client = app.test_client()
+    try:
+        for mode in (None, "x-accel-redirect"):
+            app.config["IMAGE_OFFLOAD"] = mode
+            rate, response = run(client, url, count)
+            etag = response.headers["ETag"]
+            revalidate, not_modified = run(client, url, count, headers={"If-None-Match": etag})
+            print(f"{mode or 'flask send_file':>16}: {rate:8.0f} req/s ({response.status_code}, "
+                  f"{len(response.get_data())} body bytes), revalidation {revalidate:8.0f} req/s ({not_modified.status_code})")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,67 @@
+"""Time the upload image pipeline on a synthetic 12-megapixel photo.
+
+Run from the server folder:  python -m benchmarks.images [rounds]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageFilter, features
+
+from images import SIZES, render_variants
+from storage import LocalStorage
+
+
+def make_photo(path, size=(4000, 3000)):
+    # Blurred noise over a gradient has roughly the entropy of a real photo; flat test
+    # images compress unrealistically well.
+    noise = Image.effect_noise(size, 64).filter(ImageFilter.GaussianBlur(2))
+    gradient = Image.linear_gradient("L").resize(size)
+    Image.merge("RGB", (noise, gradient, Image.blend(noise, gradient, 0.5))).save(path, "JPEG", quality=92)
+
+
+def run(source, formats, rounds, workers=None):
+    folder = tempfile.mkdtemp()
+    storage = LocalStorage(folder)
+    os.makedirs(os.path.join(folder, "src"))
+    keys = []
+    for i in range(rounds):
+        shutil.copyfile(source, os.path.join(folder, "src", f"{i}.jpg"))
+        keys.append(f"src/{i}.jpg")
+
+    started = time.perf_counter()
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_variants, [storage] * rounds, keys, [formats] * rounds))
+    else:
+        for key in keys:
+            render_variants(storage, key, formats)
+    seconds = time.perf_counter() - started
+    shutil.rmtree(folder)
+    return rounds / seconds
+
+
+def main(rounds=10):
+    folder = tempfile.mkdtemp()
+    source = os.path.join(folder, "photo.jpg")
+    make_photo(source)
+    print(f"source: 4000x3000 JPEG, {os.path.getsize(source) / 1e6:.1f} MB; sizes: {SIZES}")
+
+    format_sets = [("jpeg",), ("webp",), ("webp", "jpeg")]
+    if features.check("avif"):
+        format_sets.append(("avif",))
+    for formats in format_sets:
+        per_core = run(source, formats, rounds)
+        print(f"{'+'.join(formats):>10}: {per_core:6.2f} uploads/s per core")
+
+    cores = os.cpu_count() or 1
+    pooled = run(source, ("webp", "jpeg"), rounds * cores, workers=cores)
+    print(f"webp+jpeg with {cores} worker process(es): {pooled:6.2f} uploads/s")
+    shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
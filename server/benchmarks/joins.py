@@ -0,0 +1,122 @@
+"""Join queries before and after migration 0008 (binary UUID keys, integer wishlist user ids,
+transactions linked to users), on the same synthetic data.
+
+Run from the server folder:  python -m benchmarks.joins [listings] [repeats]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+USERS = 2000
+
+# name -> (SQL against the 0007 schema, SQL against the head schema); :address is a buyer's address.
+QUERIES = {
+    "listing images": (
+        "SELECT p.title, i.path FROM users u JOIN products p ON p.seller_id = u.id "
+        "JOIN images i ON i.product_id = p.id WHERE u.address = :address",
+        None,
+    ),
+    "wishlist products": (
+        "SELECT p.title, p.price FROM users u JOIN wishlists w ON w.user_id = u.id "
+        "JOIN products p ON p.id = w.product_id WHERE u.address = :address",
+        "SELECT p.title, p.price_gwei FROM users u JOIN wishlists w ON w.user_id = u.id "
+        "JOIN products p ON p.id = w.product_id WHERE u.address = :address",
+    ),
+    "purchases with sellers": (
+        "SELECT t.transaction_id, s.name, p.title FROM transactions t JOIN users s ON s.address = t.seller "
+        "JOIN products p ON p.id = t.product_id WHERE t.buyer = :address",
+        "SELECT t.transaction_id, s.name, p.title FROM users b JOIN transactions t ON t.buyer_id = b.id "
+        "JOIN users s ON s.id = t.seller_id JOIN products p ON p.id = t.product_id WHERE b.address = :address",
+    ),
+}
+
+
+def seed(path, listings):
+    # Seeded at 0007, where money is still float ETH; migration 0009 converts it to price_gwei.
+    connection = sqlite3.connect(path)
+    addresses = [f"0x{i:040x}" for i in range(USERS)]
+    connection.executemany(
+        "INSERT INTO users (id, email, name, address, is_seller) VALUES (?, ?, ?, ?, 1)",
+        [(i + 1, f"user{i}@example.com", f"User {i}", address) for i, address in enumerate(addresses)],
+    )
+    product_ids = [str(uuid.uuid4()) for _ in range(listings)]
+    connection.executemany(
+        "INSERT INTO products (id, title, slug, year, price, mileage, has_transaction, seller_id, created_at) "
+        "VALUES (?, ?, ?, ?, 1.5, 1000, 0, ?, '2024-01-01 00:00:00')",
+        [(pid, f"Car {i}", f"car-{i}", str(random.randint(2000, 2025)), random.randint(1, USERS))
+         for i, pid in enumerate(product_ids)],
+    )
+    connection.executemany(
+        "INSERT INTO images (id, path, product_id) VALUES (?, ?, ?)",
+        [(str(uuid.uuid4()), f"/images/{pid}/{n}.jpg", pid) for pid in product_ids for n in range(3)],
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO wishlists (user_id, product_id) VALUES (?, ?)",
+        [(str(random.randint(1, USERS)), random.choice(product_ids)) for _ in range(listings * 2)],
+    )
+    connection.executemany(
+        "INSERT INTO transactions (transaction_id, product_id, seller, buyer, amount, status, created_at) "
+        "VALUES (?, ?, ?, ?, 1.5, 0, '2024-01-01 00:00:00')",
+        [(i, random.choice(product_ids), random.choice(addresses), random.choice(addresses)) for i in range(listings)],
+    )
+    connection.commit()
+    connection.close()
+    return addresses
+
+
+def measure(path, addresses, column, repeats):
+    connection = sqlite3.connect(path)
+    connection.execute("VACUUM")   # the migration's table copies leave free pages behind
+    results = {}
+    for name, queries in QUERIES.items():
+        sql = queries[column] or queries[0]
+        plan = " / ".join(row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", {"address": addresses[0]}))
+        timings = []
+        for i in range(repeats):
+            started = time.perf_counter()
+            connection.execute(sql, {"address": addresses[i % len(addresses)]}).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (statistics.median(timings), plan)
+    size = connection.execute("PRAGMA page_count").fetchone()[0] * connection.execute("PRAGMA page_size").fetchone()[0]
+    connection.close()
+    return results, size
+
+
+def main(listings=50_000, repeats=200):
+    scratch = tempfile.mkdtemp()
+    path = os.path.join(scratch, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import app
+    from flask_migrate import upgrade
+    app.config["MAIL_QUEUE_AUTOSTART"] = False
+
+    try:
+        with app.app_context():
+            upgrade(revision="0007")
+        addresses = seed(path, listings)
+        before, size_before = measure(path, addresses, 0, repeats)
+
+        started = time.perf_counter()
+        with app.app_context():
+            upgrade()
+        migrated = time.perf_counter() - started
+        after, size_after = measure(path, addresses, 1, repeats)
+
+        print(f"{listings} listings, {listings * 3} images; migration took {migrated:.1f}s, "
+              f"database {size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB")
+        for name in QUERIES:
+            print(f"{name:>24}: {before[name][0]:8.3f} ms -> {after[name][0]:8.3f} ms (median)")
+            print(f"{'before':>24}: {before[name][1]}")
+            print(f"{'after':>24}: {after[name][1]}")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
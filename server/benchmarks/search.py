@@ -0,0 +1,103 @@
+"""Seed synthetic listings into a scratch database and time /api/search against them.
+
+Run from the server folder:  python -m benchmarks.search [listings] [queries]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+WORDS = ("clean title low mileage full service history one owner leather seats sunroof navigation "
+         "heated seats backup camera alloy wheels new tyres accident free garage kept warranty").split()
+MODELS = ["Corolla", "Camry", "Civic", "Accord", "X5", "A4", "Model 3", "Tucson", "Sportage", "Range Rover",
+          "Cayenne", "Golf", "Patrol", "Land Cruiser", "Escalade", "F-150", "Mustang", "Altima", "Q50", "RX 350"]
+QUERIES = ["toy", "land cru", "camera", "bmw x5", "one owner", "civ", "heated seats", "mustang", "warr", "golf"]
+FILTERS = {"vehicle_type": "SUV", "max_price": "40"}
+
+
+def seed(count):
+    from app import BRANDS
+    from models import db, User, Product
+
+    seller = User(email="bench@example.com", name="Bench Seller", address="0x" + "be" * 20, is_seller=True)
+    db.session.add(seller)
+    db.session.flush()
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        brand = random.choice(BRANDS)
+        model = random.choice(MODELS)
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "title": f"{random.randint(2005, 2025)} {brand} {model}",
+            "brand": brand,
+            "model": model,
+            "slug": f"bench-{i}-{uuid.uuid4()}",
+            "fuel_type": random.choice(["Petrol", "Diesel", "Electric", "Hybrid"]),
+            "transmission": random.choice(["Automatic", "Manual"]),
+            "vehicle_type": random.choice(["SUV", "Sedan", "Coupe", "Truck"]),
+            "year": random.randint(2005, 2025),
+            "description": " ".join(random.choices(WORDS, k=25)),
+            "price_gwei": random.randint(500, 80_000) * 10**6,
+            "mileage": random.randint(0, 250_000),
+            "has_transaction": False,
+            "created_at": now - timedelta(minutes=i),
+            "seller_id": seller.id,
+        })
+        if len(rows) == 5000:
+            db.session.execute(db.insert(Product), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Product), rows)
+    db.session.commit()
+
+
+def main(count=100_000, queries=200):
+    scratch = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    from app import app
+    from flask_migrate import upgrade
+
+    with app.app_context():
+        upgrade()
+        started = time.perf_counter()
+        seed(count)
+        print(f"seeded {count} listings in {time.perf_counter() - started:.1f}s")
+
+    client = app.test_client()
+    for q in QUERIES:
+        client.get("/api/search", query_string={"q": q})
+
+    by_query = {q: [] for q in QUERIES}
+    for label, filters in (("unfiltered", {}), ("filtered", FILTERS)):
+        timings = []
+        for i in range(queries):
+            q = QUERIES[i % len(QUERIES)]
+            started = time.perf_counter()
+            response = client.get("/api/search", query_string={"q": q, "limit": 20, **filters})
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200
+            if not filters:
+                by_query[q].append(timings[-1])
+
+        timings.sort()
+        print(f"{queries} {label} searches: p50 {statistics.median(timings):.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, max {timings[-1]:.2f} ms")
+
+    # bm25 scores every match, so the time follows how many listings a query matches.
+    with app.app_context():
+        from models import db
+        for q, timings in by_query.items():
+            match = " AND ".join(f'"{term}"*' for term in q.split())
+            matches = db.session.execute(db.text("SELECT count(*) FROM products_fts WHERE products_fts MATCH :match"),
+                                         {"match": match}).scalar()
+            print(f"  {q!r:<16} {matches:>7} matches  p50 {statistics.median(timings):.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,184 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from flask import current_app, make_response, request
+from sqlalchemy import event, inspect, select
+
+from models import db, Product, User, Image
+
+
+DEFAULTS = {
+    "RESPONSE_CACHE_ENABLED": True,
+    "RESPONSE_CACHE_SIZE": 2048,          # entries in each process's LRU
+    "RESPONSE_CACHE_TTL": 10 * 60,        # seconds; a backstop, entries are invalidated on write
+    # A Redis-compatible server shared by all workers (needs the redis package), e.g. redis://localhost:6379/0.
+    # Without it every process caches on its own and only sees its own invalidations.
+    "RESPONSE_CACHE_REDIS_URL": os.getenv("RESPONSE_CACHE_REDIS_URL"),
+}
+
+TAG_VERSIONS = "response-cache:tags"
+
+
+def product_tags(product):
+    """Everything a change to ``product`` shows up in."""
+    tags = {"products", "brands", f"product:{product.slug}"}
+    if product.seller is not None:
+        tags.add(f"seller:{product.seller.address}")
+    return tags
+
+
+class ResponseCache:
+    """Caches the serialized JSON of read endpoints, keyed by endpoint, arguments and tag versions.
+
+    Invalidating a tag bumps its version, so every key built with the old version stops matching,
+    in this process and, through Redis, in every other one. Tags are bumped only after the write
+    commits, so a concurrent reader can't put the old data back in between.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._redis = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, etag, body)
+        self._versions = defaultdict(int)
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "not_modified": 0})
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["response_cache"] = self
+
+        if app.config["RESPONSE_CACHE_REDIS_URL"]:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RESPONSE_CACHE_REDIS_URL needs the redis package (pip install redis).")
+            self._redis = redis.Redis.from_url(app.config["RESPONSE_CACHE_REDIS_URL"])
+
+        @event.listens_for(db.session, "after_flush")
+        def _track_changes(session, flush_context):
+            tags = session.info.setdefault("cache_tags", set())
+            for obj in (*session.new, *session.dirty, *session.deleted):
+                if isinstance(obj, Product):
+                    tags.update(product_tags(obj))
+                elif isinstance(obj, Image) and obj.product is not None:
+                    tags.update(product_tags(obj.product))
+                elif isinstance(obj, User) and inspect(obj).attrs.name.history.has_changes():
+                    # The seller's name is part of every one of their products.
+                    tags.update(("products", f"seller:{obj.address}"))
+                    slugs = session.scalars(select(Product.slug).where(Product.seller_id == obj.id))
+                    tags.update(f"product:{slug}" for slug in slugs)
+
+        @event.listens_for(db.session, "after_commit")
+        def _invalidate_committed(session):
+            tags = session.info.pop("cache_tags", None)
+            if tags:
+                self.invalidate(*tags)
+
+        @event.listens_for(db.session, "after_soft_rollback")
+        def _forget_rolled_back(session, previous_transaction):
+            session.info.pop("cache_tags", None)
+
+    def invalidate(self, *tags):
+        """Bump the version of each tag. Use directly after bulk UPDATE/DELETE statements, which skip the session."""
+        if self._redis is not None:
+            pipe = self._redis.pipeline()
+            for tag in tags:
+                pipe.hincrby(TAG_VERSIONS, tag, 1)
+            pipe.execute()
+        else:
+            with self._lock:
+                for tag in tags:
+                    self._versions[tag] += 1
+
+    def _tag_versions(self, tags):
+        if self._redis is not None:
+            return [int(v or 0) for v in self._redis.hmget(TAG_VERSIONS, tags)]
+        return [self._versions[tag] for tag in tags]
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1], entry[2]
+                del self._entries[key]
+
+        if self._redis is not None:
+            value = self._redis.get(key)
+            if value is not None:
+                etag, body = value.split(b"\n", 1)
+                self._put_local(key, etag.decode(), body)
+                return etag.decode(), body
+        return None
+
+    def _put_local(self, key, etag, body):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.app.config["RESPONSE_CACHE_TTL"], etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.app.config["RESPONSE_CACHE_SIZE"]:
+                self._entries.popitem(last=False)
+
+    def _put(self, key, etag, body):
+        self._put_local(key, etag, body)
+        if self._redis is not None:
+            self._redis.set(key, etag.encode() + b"\n" + body, ex=self.app.config["RESPONSE_CACHE_TTL"])
+
+    def _respond(self, etag, body, state):
+        stats = self._stats[request.endpoint]
+        if request.if_none_match.contains(etag):
+            stats["not_modified"] += 1
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["X-Cache"] = state
+        return response
+
+    def cached(self, tags):
+        """Cache a JSON view's 200 responses. ``tags(**view_args)`` names what the response depends on."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**view_args):
+                if not self.app.config["RESPONSE_CACHE_ENABLED"]:
+                    return view(**view_args)
+
+                view_tags = sorted(tags(**view_args))
+                versions = self._tag_versions(view_tags)
+                raw = repr((request.endpoint, sorted(view_args.items()), sorted(request.args.items(multi=True)),
+                            list(zip(view_tags, versions))))
+                key = "response-cache:" + hashlib.sha256(raw.encode()).hexdigest()
+
+                entry = self._get(key)
+                if entry is not None:
+                    self._stats[request.endpoint]["hits"] += 1
+                    return self._respond(*entry, "HIT")
+
+                self._stats[request.endpoint]["misses"] += 1
+                response = make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha256(body).hexdigest()[:32]
+                self._put(key, etag, body)
+                return self._respond(etag, body, "MISS")
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        endpoints = {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+        for counts in endpoints.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_ratio"] = round(counts["hits"] / lookups, 3) if lookups else None
+        return {"entries": entries, "shared": self._redis is not None, "endpoints": endpoints}
@@ -0,0 +1,141 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models import Product
+from money import eth_to_gwei
+
+
+BRANDS = ["Acura", "Aston-Martin", "Audi", "Avatr", "Bentley", "BMW", "BYD", "Cadillac", "Chevrolet", "Citroen",
+          "Ford", "GMC", "Honda", "Hyundai", "Infiniti", "Kia", "Land-Rover", "Lexus", "Maybach", "McLaren",
+          "Mercedes-AMG", "Mercedes-Benz", "Mitsubishi", "Nissan", "Peugeot", "Renault", "Rolls-Royce", "Tesla",
+          "Toyota", "Volkswagen"
+        ]
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Sort keys match the ones the client already puts in the URL (see FilterComponent.jsx).
+# Every ordering is made total by falling back to Product.id in the same direction.
+SORTS = {
+    "newest": (Product.created_at, True),
+    "oldest": (Product.created_at, False),
+    "priceLow": (Product.price_gwei, False),
+    "priceHigh": (Product.price_gwei, True),
+    "mileageLow": (Product.mileage, False),
+    "mileageHigh": (Product.mileage, True),
+}
+
+EXACT_FILTERS = {
+    "brand": Product.brand,
+    "fuel_type": Product.fuel_type,
+    "transmission": Product.transmission,
+    "vehicle_type": Product.vehicle_type,
+}
+
+RANGE_FILTERS = {
+    "year": Product.year,
+    "price": Product.price_gwei,   # min_price/max_price are given in ETH
+    "mileage": Product.mileage,
+}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def encode_cursor(sort, value, product_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, product_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, product_id = json.loads(raw)
+        if cursor_sort == sort:
+            column, _ = SORTS[sort]
+            value = datetime.fromisoformat(value) if column is Product.created_at else int(value)
+    except (ValueError, TypeError):
+        raise CatalogError("Invalid cursor.")
+
+    if cursor_sort != sort:
+        raise CatalogError("Cursor does not match the requested sort.")
+    return value, product_id
+
+
+def _parse_number(args, name, cast):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise CatalogError(f"Invalid value for {name}.")
+
+
+def apply_filters(query, args):
+    """Narrow a Product query by the catalog filters present in ``args`` (a request.args-like mapping)."""
+    for name, column in EXACT_FILTERS.items():
+        values = [v for v in args.getlist(name) if v]
+        if len(values) == 1:
+            query = query.filter(column == values[0])
+        elif values:
+            query = query.filter(column.in_(values))
+
+    for name, column in RANGE_FILTERS.items():
+        cast = eth_to_gwei if name == "price" else int
+        low = _parse_number(args, f"min_{name}", cast)
+        high = _parse_number(args, f"max_{name}", cast)
+        if low is not None:
+            query = query.filter(column >= low)
+        if high is not None:
+            query = query.filter(column <= high)
+
+    has_transaction = args.get("has_transaction")
+    if has_transaction:
+        if has_transaction.lower() not in ("true", "false"):
+            raise CatalogError("has_transaction must be true or false.")
+        query = query.filter(Product.has_transaction == (has_transaction.lower() == "true"))
+
+    return query
+
+
+def get_page(args):
+    """Return one keyset-paginated page of the catalog as (products, next_cursor)."""
+    sort = args.get("sort") or "newest"
+    if sort not in SORTS:
+        raise CatalogError("Unrecognised sort.")
+
+    limit = _parse_number(args, "limit", int) or DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    column, descending = SORTS[sort]
+    query = apply_filters(Product.query.options(*Product.serialization_options()), args)
+
+    cursor = args.get("cursor")
+    if cursor:
+        value, product_id = decode_cursor(cursor, sort)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, Product.id < product_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, Product.id > product_id)))
+
+    if descending:
+        query = query.order_by(column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(column.asc(), Product.id.asc())
+
+    # Fetch one extra row to know whether another page exists without a COUNT(*).
+    products = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor(sort, getattr(last, column.key), last.id)
+
+    return products, next_cursor
@@ -1,34 +1,198 @@
-from web3 import Web3
+from web3 import Web3, AsyncWeb3, AsyncHTTPProvider
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import RPCTimer
 
 load_dotenv()
 
 ALCHEMY_API_KEY = os.getenv("ALCHEMY_API_KEY")
 ALCHEMY_URL = f"https://eth-sepolia.g.alchemy.com/v2/{ALCHEMY_API_KEY}"
+# Point RPC_URL at a local node (e.g. `npx hardhat node` or anvil) for development and testing.
+RPC_URL = os.getenv("RPC_URL") or ALCHEMY_URL
 
-web3 = Web3(Web3.HTTPProvider(ALCHEMY_URL))
+web3 = Web3(Web3.HTTPProvider(RPC_URL))
+web3.middleware_onion.add(RPCTimer, name="rpc_timer")
 
-CONTRACT_ADDRESS = "0xca5c9a13495152AB6390d0A26715fF56db404B36"
+CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS", "0xca5c9a13495152AB6390d0A26715fF56db404B36")
 
-with open("abi.json", "r") as f:
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "abi.json"), "r") as f:
     abi = json.load(f)
 
 contract = web3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
 
+# Balances can only change when a block is mined, so reads are cached per (address, block).
+# The head block number itself is re-fetched at most every BLOCK_NUMBER_TTL seconds.
+BLOCK_NUMBER_TTL = float(os.getenv("BLOCK_NUMBER_TTL", 4))
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", 30))
+BALANCE_CACHE_SIZE = 10_000
+
+_lock = threading.Lock()
+_block = {"number": None, "fetched_at": 0.0, "pending": None}
+_balance_cache = {}   # (address, block) -> (expires_at, result)
+_in_flight = {}       # key -> Future shared by concurrent callers
+
+
+def _coalesce(key, fn):
+    """Run fn() once for all concurrent callers asking for the same key."""
+    with _lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        result = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+
+
+def latest_block_number():
+    now = time.monotonic()
+    if _block["number"] is not None and now - _block["fetched_at"] < BLOCK_NUMBER_TTL:
+        return _block["number"]
+
+    number = _coalesce("block_number", lambda: web3.eth.block_number)
+    _block.update(number=number, fetched_at=time.monotonic())
+    return number
+
+
+def _read_balance_and_autowithdraw(address, block):
+    # Both view calls go out as a single JSON-RPC batch, pinned to the same block.
+    with web3.batch_requests() as batch:
+        batch.add(contract.functions.balanceOf(address).call(block_identifier=block))
+        batch.add(contract.functions.getAutoWithdraw(address).call(block_identifier=block))
+        balance, status = batch.execute()
+    return {"balance": str(web3.from_wei(balance, 'ether')), "status": status}
+
+
+def _cached_balance(key):
+    cached = _balance_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _store_balance(key, result):
+    block = key[1]
+    with _lock:
+        if len(_balance_cache) >= BALANCE_CACHE_SIZE:
+            now = time.monotonic()
+            for k in [k for k, (expires_at, _) in _balance_cache.items() if expires_at <= now or k[1] < block]:
+                del _balance_cache[k]
+            if len(_balance_cache) >= BALANCE_CACHE_SIZE:
+                _balance_cache.clear()
+        _balance_cache[key] = (time.monotonic() + BALANCE_CACHE_TTL, result)
+
 
 def get_balance_and_autowithdrawStatus(address):
     if not web3.is_address(address):
         return (False, {"error": "Invalid address.", "code": 400})
     try:
         address = web3.to_checksum_address(address)
-        balance = contract.functions.balanceOf(address).call()
-        balance_eth = web3.from_wei(balance, 'ether')
-        status = contract.functions.getAutoWithdraw(address).call()
+        block = latest_block_number()
+        key = (address, block)
+
+        cached = _cached_balance(key)
+        if cached:
+            return (True, cached)
+
+        result = _coalesce(key, lambda: _read_balance_and_autowithdraw(address, block))
+        _store_balance(key, result)
+    except Exception as e:
+        return (False, {"error": str(e), "code": 500})
+    else:
+        return (True, result)
+
+
+# The same reads for the async app (async_app.py), over an asyncio provider so a worker waits on
+# many RPC calls at once. They share the block number and balance cache above.
+async_web3 = AsyncWeb3(AsyncHTTPProvider(RPC_URL))
+async_contract = async_web3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
+_async_in_flight = {}   # key -> Task shared by concurrent callers on the event loop
+
+
+async def _coalesce_async(key, fn):
+    task = _async_in_flight.get(key)
+    if task is None:
+        task = _async_in_flight[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: _async_in_flight.pop(key, None))
+    # shield: one caller giving up (client disconnect) must not cancel the read for the others.
+    return await asyncio.shield(task)
+
+
+async def latest_block_number_async():
+    now = time.monotonic()
+    if _block["number"] is not None and now - _block["fetched_at"] < BLOCK_NUMBER_TTL:
+        return _block["number"]
+
+    number = await _coalesce_async("block_number", lambda: async_web3.eth.block_number)
+    _block.update(number=number, fetched_at=time.monotonic())
+    return number
+
+
+async def _read_balance_and_autowithdraw_async(address, block):
+    async with async_web3.batch_requests() as batch:
+        batch.add(async_contract.functions.balanceOf(address).call(block_identifier=block))
+        batch.add(async_contract.functions.getAutoWithdraw(address).call(block_identifier=block))
+        balance, status = await batch.async_execute()
+    return {"balance": str(web3.from_wei(balance, 'ether')), "status": status}
+
+
+async def get_balance_and_autowithdrawStatus_async(address):
+    if not web3.is_address(address):
+        return (False, {"error": "Invalid address.", "code": 400})
+    try:
+        address = web3.to_checksum_address(address)
+        block = await latest_block_number_async()
+        key = (address, block)
+
+        cached = _cached_balance(key)
+        if cached:
+            return (True, cached)
+
+        result = await _coalesce_async(key, lambda: _read_balance_and_autowithdraw_async(address, block))
+        _store_balance(key, result)
     except Exception as e:
         return (False, {"error": str(e), "code": 500})
     else:
-        return (True, {"balance": str(balance_eth), "status": status})
-    
+        return (True, result)
+
+
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", 100))
+
+
+def read_transactions(transaction_ids, block="latest"):
+    """Read the contract's `transactions(id)` entries, RPC_BATCH_SIZE calls per JSON-RPC batch.
 
+    Returns {transaction_id: {"buyer", "seller", "amount", "confirmed_at", "status", "exists"}}.
+    """
+    transaction_ids = list(transaction_ids)
+    results = {}
+    for start in range(0, len(transaction_ids), RPC_BATCH_SIZE):
+        chunk = transaction_ids[start:start + RPC_BATCH_SIZE]
+        with web3.batch_requests() as batch:
+            for transaction_id in chunk:
+                batch.add(contract.functions.transactions(transaction_id).call(block_identifier=block))
+            responses = batch.execute()
+        for transaction_id, (buyer, seller, amount, confirmed_at, status, exists) in zip(chunk, responses):
+            results[transaction_id] = {
+                "buyer": buyer.lower(), "seller": seller.lower(), "amount": amount,
+                "confirmed_at": confirmed_at, "status": status, "exists": exists,
+            }
+    return results
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+DEFAULTS = {
+    # Applied to every new SQLite connection. WAL lets readers carry on while one request writes,
+    # and busy_timeout makes a second writer wait for the lock instead of failing with "database is locked".
+    "SQLITE_PRAGMAS": {
+        "journal_mode": "wal",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),   # ms
+        "synchronous": "normal",        # durable across app crashes; WAL only risks the last commits on power loss
+        "cache_size": -32 * 1024,       # KiB per connection
+        "temp_store": "memory",
+        "mmap_size": 256 * 1024 * 1024,
+    },
+    # PostgreSQL and other server databases; each worker process has its own pool.
+    "DATABASE_POOL_SIZE": int(os.getenv("DATABASE_POOL_SIZE", 10)),
+    "DATABASE_MAX_OVERFLOW": int(os.getenv("DATABASE_MAX_OVERFLOW", 10)),
+    "DATABASE_POOL_TIMEOUT": 10,        # seconds to wait for a free connection
+    "DATABASE_POOL_RECYCLE": 30 * 60,   # seconds; stay under server and proxy idle timeouts
+    # psycopg 3 prepares a statement on the server once it has run this many times on a connection.
+    # Set to None behind PgBouncer in transaction mode, which can't keep prepared statements.
+    "DATABASE_PREPARE_THRESHOLD": 5,
+    "DATABASE_QUERY_CACHE_SIZE": 1000,  # compiled SQL kept by SQLAlchemy, per engine
+}
+
+
+def engine_options(uri, config):
+    url = make_url(uri)
+    options = {"query_cache_size": config["DATABASE_QUERY_CACHE_SIZE"]}
+    if url.get_backend_name() == "sqlite":
+        return options   # tuned per connection with SQLITE_PRAGMAS instead
+
+    options.update(
+        pool_size=config["DATABASE_POOL_SIZE"],
+        max_overflow=config["DATABASE_MAX_OVERFLOW"],
+        pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+        pool_recycle=config["DATABASE_POOL_RECYCLE"],
+        pool_pre_ping=True,
+    )
+    if url.get_driver_name() == "psycopg" and config["DATABASE_PREPARE_THRESHOLD"] is not None:
+        options["connect_args"] = {"prepare_threshold": config["DATABASE_PREPARE_THRESHOLD"]}
+    return options
+
+
+def configure_database(app):
+    """Fill in SQLALCHEMY_ENGINE_OPTIONS for the configured database. Call before db.init_app(app)."""
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(uri, app.config),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+
+    @event.listens_for(Engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            _set_pragmas(dbapi_connection, app.config["SQLITE_PRAGMAS"])
+
+
+def _set_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+# asyncio drivers for the async app (async_app.py), both pinned in requirements.txt.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "psycopg"}
+
+
+def create_async_engine(uri, config=DEFAULTS):
+    """An AsyncEngine for the same database and settings as the Flask app's engine."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise RuntimeError(f"No asyncio driver configured for {backend}.")
+    try:
+        engine = create_async_engine(url.set(drivername=f"{backend}+{driver}"), **engine_options(uri, config))
+    except ImportError:
+        raise RuntimeError(f"The async app needs the {driver} package for {backend} (pip install {driver}).")
+
+    if backend == "sqlite":
+        @event.listens_for(engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            _set_pragmas(dbapi_connection, config["SQLITE_PRAGMAS"])
+    return engine
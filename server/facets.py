@@ -0,0 +1,156 @@
+import threading
+import time
+
+from sqlalchemy import case, event, func, literal, union_all
+from werkzeug.datastructures import MultiDict
+
+from models import db, Product
+from catalog import BRANDS, EXACT_FILTERS, RANGE_FILTERS, apply_filters
+from money import GWEI_PER_ETH
+
+
+YEAR_BUCKET_SIZE = 5
+# Lower edges (ETH) of the price histogram buckets; the last bucket is open-ended.
+PRICE_BUCKETS = (0, 0.5, 1, 2, 5, 10, 25, 50)
+
+DEFAULTS = {
+    "FACETS_CACHE_TTL": 300,   # seconds; a backstop for commits made by other processes
+}
+
+FILTER_ARGS = (
+    set(EXACT_FILTERS)
+    | {f"{bound}_{name}" for name in RANGE_FILTERS for bound in ("min", "max")}
+    | {"has_transaction"}
+)
+
+
+def _year_bucket():
+    return RANGE_FILTERS["year"] // YEAR_BUCKET_SIZE * YEAR_BUCKET_SIZE
+
+
+def _price_bucket():
+    return case(
+        *((Product.price_gwei < int(edge * GWEI_PER_ETH), index) for index, edge in enumerate(PRICE_BUCKETS[1:])),
+        else_=len(PRICE_BUCKETS) - 1,
+    )
+
+
+def _without(args, name):
+    # A facet is counted with every filter except its own, so picking one brand
+    # still shows how many listings the other brands would give.
+    args = MultiDict(args)
+    for key in (name, f"min_{name}", f"max_{name}"):
+        args.poplist(key)
+    return args
+
+
+def _counts(name, expression, args):
+    query = apply_filters(Product.query, _without(args, name)).filter(expression.is_not(None))
+    return query.with_entities(
+        literal(name).label("facet"),
+        db.cast(expression, db.String).label("value"),
+        func.count().label("count"),
+    ).group_by(expression).statement
+
+
+def facet_counts(args):
+    """Per-value listing counts for the sidebar filters, narrowed by the catalog filters in ``args``.
+
+    Every facet is a GROUP BY over products; they are glued together with UNION ALL so the
+    whole summary costs one round-trip.
+    """
+    facets = {name: column for name, column in EXACT_FILTERS.items()}
+    facets["year"] = _year_bucket()
+    facets["price"] = _price_bucket()
+
+    total = apply_filters(Product.query, args).with_entities(
+        literal("total").label("facet"),
+        db.cast(literal(""), db.String).label("value"),
+        func.count(Product.id).label("count"),
+    ).statement
+    statements = [total] + [_counts(name, expression, args) for name, expression in facets.items()]
+
+    counts = {name: {} for name in facets}
+    result = {"total": 0}
+    for facet, value, count in db.session.execute(union_all(*statements)):
+        if facet == "total":
+            result["total"] = count
+        else:
+            counts[facet][value] = count
+
+    for name in EXACT_FILTERS:
+        values = counts[name]
+        if name == "brand":
+            values = {**dict.fromkeys(BRANDS, 0), **values}
+        result[name] = [
+            {"value": value, "count": count}
+            for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+    result["year"] = sorted(
+        ({"from": int(start), "to": int(start) + YEAR_BUCKET_SIZE - 1, "count": count}
+         for start, count in counts["year"].items()),
+        key=lambda bucket: bucket["from"], reverse=True,
+    )
+
+    result["price"] = []
+    for index, low in enumerate(PRICE_BUCKETS):
+        high = PRICE_BUCKETS[index + 1] if index + 1 < len(PRICE_BUCKETS) else None
+        result["price"].append({"min": low, "max": high, "count": counts["price"].get(str(index), 0)})
+
+    return result
+
+
+class FacetCache:
+    """Keeps the unfiltered facet summary in memory until a commit touches a product."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._summary = None
+        self._expires_at = 0.0
+        self._generation = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["facet_cache"] = self
+
+        # Adding, editing and deleting listings, and create-transaction flipping has_transaction,
+        # all flush a Product; the summary is dropped once that commit lands.
+        @event.listens_for(db.session, "after_flush")
+        def _track_products(session, flush_context):
+            if any(isinstance(obj, Product) for obj in (*session.new, *session.dirty, *session.deleted)):
+                session.info["facets_dirty"] = True
+
+        @event.listens_for(db.session, "after_commit")
+        def _invalidate(session):
+            if session.info.pop("facets_dirty", False):
+                self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._summary = None
+            self._generation += 1
+
+    def summary(self):
+        with self._lock:
+            if self._summary is not None and self._expires_at > time.monotonic():
+                return self._summary
+            generation = self._generation
+
+        summary = facet_counts(MultiDict())
+        with self._lock:
+            # Don't keep a summary that a commit made while it was being computed has already outdated.
+            if generation == self._generation:
+                self._summary = summary
+                self._expires_at = time.monotonic() + self.app.config["FACETS_CACHE_TTL"]
+        return summary
+
+    def get(self, args):
+        if any(args.get(name) for name in FILTER_ARGS):
+            return facet_counts(args)
+        return self.summary()
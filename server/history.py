@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Date, and_, func, or_, select
+
+from models import db, Transaction
+from money import gwei_to_eth, gwei_to_wei
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+ROLES = {"buyer": Transaction.buyer_id, "seller": Transaction.seller_id}
+STATUS_NUMBERS = {name.lower(): number for number, name in Transaction.status_mapping.items()}
+
+# Statuses whose funds the contract still holds: until the seller claims (Finalized) or the
+# buyer is refunded (Cancelled), the ETH sits in escrow.
+ESCROW_STATUSES = {0, 1, 2, 3}
+
+INTERVALS = ("day", "week", "month")
+DEFAULT_DAYS = 365
+MAX_DAYS = 5 * 365
+
+
+class HistoryError(ValueError):
+    pass
+
+
+def _encode_cursor(created_at, id):
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HistoryError("Invalid cursor.")
+
+
+def _int_arg(args, name, default, low, high):
+    value = args.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return max(low, min(int(value), high))
+    except ValueError:
+        raise HistoryError(f"Invalid value for {name}.")
+
+
+def parse_statuses(args):
+    """Status numbers for the ``status`` args, given as status_mapping names (any case) or numbers."""
+    numbers = set()
+    for value in args.getlist("status"):
+        for name in filter(None, value.split(",")):
+            name = name.strip().lower()
+            if name in STATUS_NUMBERS:
+                numbers.add(STATUS_NUMBERS[name])
+            elif name.isdigit() and int(name) in Transaction.status_mapping:
+                numbers.add(int(name))
+            else:
+                raise HistoryError(f"Unrecognised status: {name}.")
+    return numbers
+
+
+def get_page(user, args):
+    """One page of a user's transactions as buyer or seller, newest first, as (transactions, next_cursor)."""
+    role = args.get("role") or "buyer"
+    if role not in ROLES:
+        raise HistoryError("role must be buyer or seller.")
+    limit = _int_arg(args, "limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+
+    # Served by the (buyer_id|seller_id, created_at) indexes.
+    query = select(Transaction).options(*Transaction.serialization_options()).where(ROLES[role] == user.id)
+    statuses = parse_statuses(args)
+    if statuses:
+        query = query.where(Transaction.status.in_(statuses))
+
+    cursor = args.get("cursor")
+    if cursor:
+        created_at, id = _decode_cursor(cursor)
+        query = query.where(or_(Transaction.created_at < created_at,
+                                and_(Transaction.created_at == created_at, Transaction.id < id)))
+
+    transactions = db.session.scalars(
+        query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1)
+    ).unique().all()
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = _encode_cursor(transactions[-1].created_at, transactions[-1].id)
+    return transactions, next_cursor
+
+
+def _bucket(interval):
+    """created_at truncated to the start of its day, ISO week or month, as a date."""
+    if db.session.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(interval, Transaction.created_at).cast(Date)
+    if interval == "day":
+        return func.date(Transaction.created_at)
+    if interval == "week":
+        return func.date(Transaction.created_at, "-6 days", "weekday 1")   # the Monday on or before
+    return func.date(Transaction.created_at, "start of month")
+
+
+def _amounts(count, gwei):
+    gwei = int(gwei or 0)   # PostgreSQL's SUM over bigint is a numeric, i.e. a Decimal
+    return {"count": count, "total": gwei_to_eth(gwei), "total_wei": str(gwei_to_wei(gwei))}
+
+
+def summary(user, args):
+    """Counts and totals per status, volume per interval and escrowed funds, for both of the user's roles.
+
+    Everything is aggregated by the database; each role costs two GROUP BY queries on its index.
+    """
+    interval = args.get("interval") or "month"
+    if interval not in INTERVALS:
+        raise HistoryError(f"interval must be one of {', '.join(INTERVALS)}.")
+    days = _int_arg(args, "days", DEFAULT_DAYS, 1, MAX_DAYS)
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+
+    result = {"interval": interval, "days": days}
+    for role, column in ROLES.items():
+        by_status = db.session.execute(
+            select(Transaction.status, func.count(), func.sum(Transaction.amount_gwei))
+            .where(column == user.id)
+            .group_by(Transaction.status)
+        ).all()
+
+        bucket = _bucket(interval).label("bucket")
+        volume = db.session.execute(
+            select(bucket, func.count(), func.sum(Transaction.amount_gwei))
+            .where(column == user.id, Transaction.created_at >= since)
+            .group_by(bucket)
+            .order_by(bucket)
+        ).all()
+
+        result[role] = {
+            **_amounts(sum(count for _, count, _ in by_status), sum(gwei or 0 for _, _, gwei in by_status)),
+            "by_status": {Transaction.status_mapping.get(status, str(status)): _amounts(count, gwei)
+                          for status, count, gwei in by_status},
+            "escrow": _amounts(sum(count for status, count, _ in by_status if status in ESCROW_STATUSES),
+                               sum(gwei or 0 for status, _, gwei in by_status if status in ESCROW_STATUSES)),
+            "volume": [{"period": str(period)[:10], **_amounts(count, gwei)} for period, count, gwei in volume],
+        }
+    return result
@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from eth_utils import is_checksum_address, is_checksum_formatted_address, is_hex_address
+from flask import abort
+from sqlalchemy import event, inspect
+
+from models import db, User
+
+
+DEFAULTS = {
+    "IDENTITY_CACHE_SIZE": 10_000,     # addresses in each process's LRU
+    # Seconds a process trusts its own copy. Changes made through this app invalidate it at once
+    # in the process that made them; other processes catch up within this time.
+    "IDENTITY_CACHE_TTL": 60,
+    # Optional shared tier (needs the redis package), e.g. redis://localhost:6379/0. Workers then
+    # fill each other's misses, and invalidations reach it as soon as they commit.
+    "IDENTITY_CACHE_REDIS_URL": os.getenv("IDENTITY_CACHE_REDIS_URL"),
+    "IDENTITY_CACHE_SHARED_TTL": 60 * 60,
+}
+
+FIELDS = ("id", "address", "name", "email", "is_seller", "is_admin")
+SHARED_KEY = "identity:{}"
+
+
+def normalize_address(address):
+    """The stored (lowercase) form of a wallet address, or None if it isn't one.
+
+    All-lowercase and all-uppercase hex are accepted as is; mixed case must carry a valid
+    EIP-55 checksum, so a mistyped checksummed address is rejected instead of matching nothing.
+    """
+    if not isinstance(address, str):
+        return None
+    address = address.strip()
+    if not address.startswith("0x") or not is_hex_address(address):
+        return None
+    if is_checksum_formatted_address(address) and not is_checksum_address(address):
+        return None
+    return address.lower()
+
+
+class Identity:
+    """A read-only snapshot of a User: what most routes need to know about the caller.
+
+    It lives outside any session, so it is safe to share between requests and threads. Load the
+    User itself (db.session.get(User, identity.id)) to change it.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for name in FIELDS:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Identity is read-only.")
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{name: getattr(user, name) for name in FIELDS})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+
+class IdentityCache:
+    """Resolves wallet addresses to Identity snapshots through an LRU, a shared tier and the database.
+
+    Entries are dropped when a User is inserted, changed or deleted, once the change commits.
+    Unknown addresses are not cached, so a wallet can be looked up right after it registers.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._redis = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # address -> (expires_at, Identity)
+        self._generation = 0            # bumped by every invalidation
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["identity_cache"] = self
+
+        if app.config["IDENTITY_CACHE_REDIS_URL"]:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("IDENTITY_CACHE_REDIS_URL needs the redis package (pip install redis).")
+            self._redis = redis.Redis.from_url(app.config["IDENTITY_CACHE_REDIS_URL"])
+
+        @event.listens_for(db.session, "after_flush")
+        def _track_users(session, flush_context):
+            addresses = session.info.setdefault("identity_addresses", set())
+            for obj in (*session.new, *session.dirty, *session.deleted):
+                if isinstance(obj, User):
+                    addresses.add(obj.address)
+                    history = inspect(obj).attrs.address.history
+                    addresses.update(history.deleted or ())   # the old address of a changed one
+
+        @event.listens_for(db.session, "after_commit")
+        def _invalidate_committed(session):
+            addresses = session.info.pop("identity_addresses", None)
+            if addresses:
+                self.invalidate(*addresses)
+
+        @event.listens_for(db.session, "after_soft_rollback")
+        def _forget_rolled_back(session, previous_transaction):
+            session.info.pop("identity_addresses", None)
+
+    def lookup(self, address):
+        """The Identity registered for ``address`` (any case), or None."""
+        address = normalize_address(address)
+        if address is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(address)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        identity = self._shared_get(address)
+        if identity is None:
+            user = db.session.execute(db.select(User).filter_by(address=address)).scalar_one_or_none()
+            if user is None:
+                return None
+            identity = Identity.from_user(user)
+            if generation == self._generation:
+                self._shared_set(identity)
+        self._remember(identity, generation)
+        return identity
+
+    def get_or_404(self, address):
+        identity = self.lookup(address)
+        if identity is None:
+            abort(404)
+        return identity
+
+    def user(self, address):
+        """The User row for ``address``, for routes that change it; None if it isn't registered."""
+        identity = self.lookup(address)
+        return db.session.get(User, identity.id) if identity else None
+
+    def invalidate(self, *addresses):
+        with self._lock:
+            self._generation += 1
+            for address in addresses:
+                self._entries.pop(address, None)
+        if self._redis is not None and addresses:
+            self._redis.delete(*(SHARED_KEY.format(address) for address in addresses))
+
+    def _remember(self, identity, generation):
+        expires_at = time.monotonic() + self.app.config["IDENTITY_CACHE_TTL"]
+        with self._lock:
+            if generation != self._generation:
+                return   # something was invalidated while this was read; it may be the old row
+            self._entries[identity.address] = (expires_at, identity)
+            self._entries.move_to_end(identity.address)
+            while len(self._entries) > self.app.config["IDENTITY_CACHE_SIZE"]:
+                self._entries.popitem(last=False)
+
+    def _shared_get(self, address):
+        if self._redis is None:
+            return None
+        raw = self._redis.get(SHARED_KEY.format(address))
+        return Identity(**json.loads(raw)) if raw else None
+
+    def _shared_set(self, identity):
+        if self._redis is not None:
+            self._redis.set(SHARED_KEY.format(identity.address), json.dumps(identity.to_dict()),
+                            ex=self.app.config["IDENTITY_CACHE_SHARED_TTL"])
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "shared": self._redis is not None,
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from PIL import Image as PILImage, ImageOps, features
+from sqlalchemy import event, update
+
+from cache import product_tags
+from models import db, Image
+from storage import key_for
+
+
+# Variant name -> longest edge in pixels. Ordered largest first: each size is resized from
+# the previous one instead of from the full-resolution original.
+SIZES = {"detail": 1600, "card": 640, "thumb": 240}
+
+QUALITY = {"avif": 55, "webp": 80, "jpeg": 82}
+SAVE_OPTIONS = {
+    "avif": {"speed": 8},
+    "webp": {"method": 4},
+    "jpeg": {"optimize": True, "progressive": True},
+}
+
+# Part of every variant's file name, so changing a size or an encoder setting gives the new
+# files new URLs instead of fighting year-long immutable caches.
+VARIANT_VERSION = hashlib.sha256(repr((SIZES, QUALITY, SAVE_OPTIONS)).encode()).hexdigest()[:8]
+
+DEFAULTS = {
+    "IMAGE_WORKERS": os.cpu_count() or 1,   # 0 processes uploads inline, for scripts and tests
+    "IMAGE_FORMATS": ("webp", "jpeg"),      # add "avif" where Pillow was built with it
+}
+
+
+def render_variants(storage, key, formats):
+    """Store every size/format variant next to ``key`` in ``storage``. Runs in a worker process.
+
+    Returns the original's dimensions and a list of {"name", "format", "width", "height", "file"}.
+    """
+    folder, filename = key.rsplit("/", 1)
+    with storage.fetch(key) as source, PILImage.open(source) as original:
+        width, height = original.size
+        if original.getexif().get(0x0112) in (5, 6, 7, 8):   # EXIF orientations rotated by 90 degrees
+            width, height = height, width
+        # JPEGs can be decoded straight at a reduced scale, which is far cheaper than a full decode.
+        original.draft("RGB", (SIZES["detail"], SIZES["detail"]))
+        im = ImageOps.exif_transpose(original).convert("RGB")
+
+    variants = []
+    with tempfile.TemporaryDirectory(dir=storage.scratch) as out:
+        for name, edge in SIZES.items():
+            im.thumbnail((edge, edge), PILImage.LANCZOS, reducing_gap=2.0)
+            for fmt in formats:
+                file = f"{filename}.{name}-{VARIANT_VERSION}.{fmt}"
+                path = os.path.join(out, file)
+                im.save(path, fmt.upper(), quality=QUALITY[fmt], **SAVE_OPTIONS[fmt])
+                storage.put(f"{folder}/{file}", path)
+                variants.append({"name": name, "format": fmt, "width": im.width, "height": im.height, "file": file})
+    return {"width": width, "height": height, "variants": variants}
+
+
+class ImagePipeline:
+    """Renders resized, re-encoded variants of uploaded images in a process pool.
+
+    New Image rows are picked up once the request commits; the variants and dimensions are
+    written back to the row when the worker finishes. Until then to_dict serves the original.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["image_pipeline"] = self
+
+        unsupported = [fmt for fmt in app.config["IMAGE_FORMATS"] if not features.check(fmt.replace("jpeg", "jpg"))]
+        if unsupported:
+            raise RuntimeError(f"Pillow was built without support for: {', '.join(unsupported)}")
+
+        @event.listens_for(db.session, "after_flush")
+        def _track_images(session, flush_context):
+            # Rows reusing an already rendered blob (see uploads.new_image) arrive with their variants.
+            new = [(image.id, image.path) for image in session.new if isinstance(image, Image) and image.variants is None]
+            if new:
+                session.info.setdefault("new_images", []).extend(new)
+
+        @event.listens_for(db.session, "after_commit")
+        def _submit_images(session):
+            for image_id, url in session.info.pop("new_images", []):
+                self.submit(image_id, url)
+
+        @event.listens_for(db.session, "after_soft_rollback")
+        def _drop_images(session, previous_transaction):
+            session.info.pop("new_images", None)
+
+        @app.cli.command("images-backfill")
+        def images_backfill_command():
+            """Render variants for every image that doesn't have them yet."""
+            pending = db.session.execute(db.select(Image.id, Image.path).where(Image.variants.is_(None))).all()
+            for image_id, url in pending:
+                self.submit(image_id, url)
+            self.wait()
+            click.echo(f"Processed {len(pending)} image(s).")
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.app.config["IMAGE_WORKERS"])
+            return self._pool
+
+    def wait(self):
+        """Block until every submitted image is rendered and stored. For CLI commands."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)   # also waits for the results to be stored
+
+    def submit(self, image_id, url):
+        args = (self.app.extensions["storage"].backend, key_for(url), tuple(self.app.config["IMAGE_FORMATS"]))
+        if not self.app.config["IMAGE_WORKERS"]:
+            self._store(image_id, url, render_variants, *args)
+            return None
+
+        future = self._executor().submit(render_variants, *args)
+        future.add_done_callback(lambda done: self._store(image_id, url, done.result))
+        return future
+
+    def _store(self, image_id, url, fn, *args):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.app.logger.error("Could not render variants for %s: %s", url, e)
+            return
+
+        with self.app.app_context():
+            db.session.execute(update(Image).where(Image.id == image_id).values(**result))
+            db.session.commit()
+            # A bulk UPDATE skips the session events, so cached responses showing this image are dropped here.
+            response_cache = self.app.extensions.get("response_cache")
+            image = db.session.get(Image, image_id)
+            if response_cache is not None and image is not None:
+                response_cache.invalidate(*product_tags(image.product))
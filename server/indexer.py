@@ -0,0 +1,226 @@
+import threading
+
+from sqlalchemy import and_, or_, update
+
+from models import db, Transaction, ChainCheckpoint, User
+from contract import web3, contract, read_transactions
+from mail_file import transaction_mails
+from mail_queue import enqueue
+
+
+CHECKPOINT_NAME = "ecommerce-events"
+
+# Contract event -> the status it moves a transaction to. Statuses only ever increase on chain
+# (Pending -> Delivered -> Confirmed -> Disputed -> Cancelled, or Confirmed -> Finalized).
+EVENT_STATUS = {
+    "NewTransaction": 0,
+    "Delivered": 1,
+    "TransactionConfirmed": 2,
+    "BuyerDisputed": 3,
+    "TransactionCancelledEvent": 4,
+    "SellerConfirmed": 4,
+    "SellerClaimed": 5,
+}
+
+DEFAULTS = {
+    "INDEXER_AUTOSTART": False,
+    "INDEXER_START_BLOCK": 0,         # set to the contract's deployment block
+    "INDEXER_CONFIRMATIONS": 12,      # blocks behind head, so shallow reorgs never reach the DB
+    "INDEXER_CHUNK_SIZE": 2000,       # blocks per eth_getLogs; halved while the node refuses, then grown back
+    "INDEXER_REORG_REWIND": 64,       # blocks re-scanned when the checkpoint block was reorged out
+    "INDEXER_POLL_INTERVAL": 15,
+}
+
+
+def _event_abi(name, *inputs):
+    return {"type": "event", "name": name, "anonymous": False, "inputs": [
+        {"name": arg, "type": type_, "indexed": indexed} for arg, type_, indexed in inputs
+    ]}
+
+
+# contract/contracts/Ecommerce.sol emits these with a trailing transactionId, which the older
+# deployment in abi.json doesn't have. The extra argument changes the topic hash, so both
+# signatures are followed: abi.json's for that deployment, these for any deployment of the
+# contract in this repo (e.g. on a local Hardhat or anvil node).
+SOURCE_EVENTS = [
+    _event_abi("Delivered", ("buyer", "address", True), ("seller", "address", True),
+               ("amount", "uint256", False), ("transactionId", "uint256", False)),
+    _event_abi("TransactionConfirmed", ("buyer", "address", True), ("seller", "address", True),
+               ("amount", "uint256", False), ("transactionId", "uint256", False)),
+    _event_abi("TransactionCancelledEvent", ("buyer", "address", True), ("seller", "address", True),
+               ("cancelledAt", "uint256", False), ("transactionId", "uint256", False)),
+]
+
+
+def _events_by_topic():
+    source = web3.eth.contract(address=contract.address, abi=SOURCE_EVENTS)
+    events = {}
+    for events_of in (contract.events, source.events):
+        for name in EVENT_STATUS:
+            if hasattr(events_of, name):
+                event = getattr(events_of, name)
+                events[event.topic] = event
+    missing = set(EVENT_STATUS) - {event.event_name for event in events.values()}
+    if missing:
+        raise RuntimeError(f"No ABI entry for indexed event(s): {', '.join(sorted(missing))}")
+    return events
+
+
+EVENTS_BY_TOPIC = _events_by_topic()
+
+
+class EventIndexer:
+    def __init__(self, app=None):
+        self.app = None
+        self.chunk_size = None
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        self.chunk_size = app.config["INDEXER_CHUNK_SIZE"]
+        app.extensions["event_indexer"] = self
+
+        @app.before_request
+        def _autostart():
+            if app.config["INDEXER_AUTOSTART"] and self._thread is None:
+                self.start()
+
+        @app.cli.command("index-events")
+        def index_events_command():
+            """Sync contract events into the transactions table, then keep following the chain."""
+            self.run()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="event-indexer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    self.sync()
+            except Exception as e:
+                self.app.logger.exception("Event indexer error: %s", e)
+            self._stop.wait(self.app.config["INDEXER_POLL_INTERVAL"])
+
+    def sync(self):
+        """Index every confirmed block after the checkpoint. Returns the number of transactions updated."""
+        config = self.app.config
+        target = web3.eth.block_number - config["INDEXER_CONFIRMATIONS"]
+        start = self._resume_block()
+        updated = 0
+
+        while start <= target:
+            end = min(start + self.chunk_size - 1, target)
+            try:
+                logs = web3.eth.get_logs({
+                    "address": contract.address,
+                    "fromBlock": start,
+                    "toBlock": end,
+                    "topics": [list(EVENTS_BY_TOPIC)],
+                })
+            except Exception:
+                # Providers cap the block range / result size of eth_getLogs; retry with a smaller window.
+                if self.chunk_size == 1:
+                    raise
+                self.chunk_size = max(1, self.chunk_size // 2)
+                continue
+
+            # Grow back after a success, so one transient error doesn't leave it scanning tiny windows.
+            self.chunk_size = min(self.chunk_size * 2, config["INDEXER_CHUNK_SIZE"])
+
+            updated += self._apply(logs, end)
+            self._save_checkpoint(end)
+            db.session.commit()
+            start = end + 1
+
+        return updated
+
+    def _resume_block(self):
+        config = self.app.config
+        checkpoint = db.session.get(ChainCheckpoint, CHECKPOINT_NAME)
+        if checkpoint is None:
+            return config["INDEXER_START_BLOCK"]
+
+        block = web3.eth.get_block(checkpoint.block_number)
+        if block["hash"].to_0x_hex() != checkpoint.block_hash:
+            rewind_to = max(config["INDEXER_START_BLOCK"], checkpoint.block_number - config["INDEXER_REORG_REWIND"])
+            self.app.logger.warning("Block %s was reorged out; re-indexing from %s.", checkpoint.block_number, rewind_to)
+            return rewind_to
+        return checkpoint.block_number + 1
+
+    def _save_checkpoint(self, block_number):
+        block_hash = web3.eth.get_block(block_number)["hash"].to_0x_hex()
+        checkpoint = db.session.get(ChainCheckpoint, CHECKPOINT_NAME)
+        if checkpoint is None:
+            db.session.add(ChainCheckpoint(name=CHECKPOINT_NAME, block_number=block_number, block_hash=block_hash))
+        else:
+            checkpoint.block_number = block_number
+            checkpoint.block_hash = block_hash
+
+    def _apply(self, logs, block_number):
+        statuses = {}
+        parties = set()
+        for log in logs:
+            event = EVENTS_BY_TOPIC.get(log["topics"][0].to_0x_hex())
+            if event is None:
+                continue
+            args = event.process_log(log)["args"]
+            transaction_id = args.get("transactionId", args.get("transaction_id"))
+            if transaction_id is None:
+                # The deployed contract's Delivered, TransactionConfirmed and TransactionCancelledEvent
+                # only name the buyer and seller, so those are resolved against on-chain state below.
+                parties.add((args["buyer"].lower(), args["seller"].lower()))
+            else:
+                status = EVENT_STATUS[event.event_name]
+                statuses[transaction_id] = max(status, statuses.get(transaction_id, status))
+
+        if parties:
+            addresses = {address for pair in parties for address in pair}
+            user_ids = dict(db.session.execute(db.select(User.address, User.id).where(User.address.in_(addresses))).all())
+            pairs = [(user_ids[buyer], user_ids[seller]) for buyer, seller in parties
+                     if buyer in user_ids and seller in user_ids]
+            open_ids = db.session.scalars(
+                db.select(Transaction.transaction_id).where(
+                    Transaction.status < 4,
+                    or_(*(and_(Transaction.buyer_id == buyer, Transaction.seller_id == seller) for buyer, seller in pairs)),
+                )
+            ).all() if pairs else []
+            for transaction_id, state in read_transactions(set(open_ids), block=block_number).items():
+                if state["exists"]:
+                    statuses[transaction_id] = max(state["status"], statuses.get(transaction_id, 0))
+
+        return self.apply_statuses(statuses)
+
+    def apply_statuses(self, statuses):
+        """Bulk-advance DB transactions to the given on-chain statuses and queue the matching emails.
+
+        Rows are never moved backwards, so an event replayed after a rewind is harmless. NewTransaction
+        events without a DB row are skipped: only create-transaction knows which product was bought.
+        """
+        if not statuses:
+            return 0
+
+        rows = Transaction.query.options(*Transaction.serialization_options()).filter(
+            Transaction.transaction_id.in_(list(statuses))
+        ).all()
+        advanced = [(row, statuses[row.transaction_id]) for row in rows if statuses[row.transaction_id] > row.status]
+        if not advanced:
+            return 0
+
+        db.session.execute(update(Transaction), [{"id": row.id, "status": status} for row, status in advanced])
+
+        for row, status in advanced:
+            for msg in transaction_mails(row.transaction_id, row.product, row.buyer, row.seller, status=status):
+                enqueue(msg)
+
+        return len(advanced)
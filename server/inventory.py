@@ -0,0 +1,398 @@
+import csv
+import io
+import json
+import posixpath
+import re
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from sqlalchemy import insert, select
+
+from catalog import BRANDS
+from models import db, new_uuid, Image, Product
+from money import eth_to_gwei, wei_to_gwei
+from storage import current_storage, key_for
+from uploads import store_stream
+
+
+DEFAULTS = {
+    "IMPORT_MAX_ROWS": 5000,        # products per import file
+    "IMPORT_CHUNK_SIZE": 500,       # products (and their images) per batch of INSERTs and per transaction
+    "IMPORT_IMAGE_WORKERS": 8,      # threads extracting and storing images; variants are the image pipeline's job
+    "EXPORT_BATCH_SIZE": 500,       # products loaded per round trip while streaming an export
+}
+
+FIELDS = ("title", "brand", "model", "fuel_type", "transmission", "vehicle_type", "year", "description",
+          "price", "price_wei", "mileage")
+IMAGE_SEPARATOR = "|"   # between the images of a CSV row
+MANIFEST_EXTENSIONS = (".csv", ".jsonl", ".ndjson")
+MAX_ERRORS = 100        # row errors reported back
+
+BRAND_NAMES = {brand.lower(): brand for brand in BRANDS}
+
+
+class InventoryError(ValueError):
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+# Reading. Every row becomes a dict of FIELDS (str or None) plus "images", a list of references:
+# a file in the zip, or the URL of an image already in the store (as an export writes them).
+
+def _value(value):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _images(value):
+    if isinstance(value, list):
+        return [ref for ref in map(_value, value) if ref]
+    return [ref.strip() for ref in (_value(value) or "").split(IMAGE_SEPARATOR) if ref.strip()]
+
+
+def _row(record):
+    record = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+    return {**{name: _value(record.get(name)) for name in FIELDS}, "images": _images(record.get("images"))}
+
+
+def _read_csv(text):
+    for record in csv.DictReader(text):
+        yield _row(record), None
+
+
+def _read_jsonl(text):
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None, "Not valid JSON."
+            continue
+        if not isinstance(record, dict):
+            yield None, "Each line must be a JSON object."
+            continue
+        yield _row(record), None
+
+
+def _read(binary, jsonl, max_rows):
+    """(rows, parse errors by row index), at most ``max_rows`` of them."""
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+    rows, errors = [], {}
+    try:
+        for row, error in (_read_jsonl if jsonl else _read_csv)(text):
+            if len(rows) == max_rows:
+                raise InventoryError(f"At most {max_rows} products per import.")
+            if error:
+                errors[len(rows)] = error
+            rows.append(row)
+    except UnicodeDecodeError:
+        raise InventoryError("Import files must be UTF-8 text.")
+    except csv.Error as e:
+        raise InventoryError(f"Invalid CSV: {e}")
+    finally:
+        text.detach()
+    return rows, errors
+
+
+def read_file(file, max_rows):
+    """Parse a CSV, JSONL or zip import from a seekable binary file.
+
+    Returns (rows, parse errors, archive, folder): for a zip, the archive images are read from
+    and the folder of its .csv/.jsonl manifest, which image names are relative to.
+    """
+    head = file.read(512)
+    file.seek(0)
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            raise InventoryError("Invalid zip file.")
+        manifests = [name for name in archive.namelist()
+                     if name.lower().endswith(MANIFEST_EXTENSIONS) and not name.startswith("__MACOSX/")]
+        if len(manifests) != 1:
+            raise InventoryError("A zip import must contain exactly one .csv or .jsonl file.")
+        with archive.open(manifests[0]) as member:
+            rows, errors = _read(member, not manifests[0].lower().endswith(".csv"), max_rows)
+        return rows, errors, archive, posixpath.dirname(manifests[0])
+
+    jsonl = head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"{")
+    rows, errors = _read(file, jsonl, max_rows)
+    return rows, errors, None, ""
+
+
+# Validation runs column by column, checking each distinct value once: a dealer's file repeats
+# the same few brands, fuel types and prices over hundreds of rows.
+
+def _title(value):
+    if not value:
+        raise ValueError("title is required.")
+    if len(value) > 200:
+        raise ValueError("title is longer than 200 characters.")
+    return value
+
+
+def _brand(value):
+    if (value or "").lower() not in BRAND_NAMES:
+        raise ValueError("Unrecognised brand.")
+    return BRAND_NAMES[value.lower()]
+
+
+def _text(name, limit=250):
+    def check(value):
+        if value and len(value) > limit:
+            raise ValueError(f"{name} is longer than {limit} characters.")
+        return value
+    return check
+
+
+def _whole(name, default=None):
+    def check(value):
+        if value is None:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a whole number.")
+        if number < 0:
+            raise ValueError(f"{name} can't be negative.")
+        return number
+    return check
+
+
+def _price(value):
+    price, price_wei = value
+    if price_wei is not None:
+        return wei_to_gwei(price_wei)   # exact, as exports write it
+    if price is None:
+        raise ValueError("price is required.")
+    return eth_to_gwei(price)
+
+
+CHECKS = {
+    "title": _title,
+    "brand": _brand,
+    "model": _text("model"),
+    "fuel_type": _text("fuel_type"),
+    "transmission": _text("transmission"),
+    "vehicle_type": _text("vehicle_type"),
+    "year": _whole("year"),
+    "description": lambda value: value,
+    "mileage": _whole("mileage", default=0),
+}
+
+
+def _check_column(values, check):
+    """[(result, error)] for a column, calling ``check`` once per distinct value."""
+    outcomes = {}
+    for value in set(values):
+        try:
+            outcomes[value] = (check(value), None)
+        except ValueError as e:   # MoneyError included
+            outcomes[value] = (None, str(e))
+    return [outcomes[value] for value in values]
+
+
+def validate(rows, errors):
+    """Product column values for every row. Raises InventoryError listing the invalid rows."""
+    valid = [i for i in range(len(rows)) if i not in errors]
+    columns = {name: _check_column([rows[i][name] for i in valid], check) for name, check in CHECKS.items()}
+    columns["price_gwei"] = _check_column([(rows[i]["price"], rows[i]["price_wei"]) for i in valid], _price)
+
+    records = []
+    for position, i in enumerate(valid):
+        record = {}
+        for name, outcomes in columns.items():
+            value, error = outcomes[position]
+            if error:
+                errors.setdefault(i, error)
+            record[name] = value
+        records.append(record)
+    _raise_for(errors, len(rows))
+    return records
+
+
+def _raise_for(errors, total):
+    if errors:
+        raise InventoryError(f"{len(errors)} of {total} rows are invalid; nothing was imported.",
+                             [{"row": i + 1, "error": errors[i]} for i in sorted(errors)[:MAX_ERRORS]])
+
+
+def store_images(rows, archive, folder, base_url, workers):
+    """Resolve every distinct image reference to the URL of a stored blob, several at a time.
+
+    Zip members are decompressed, hashed and stored by a thread pool (the work happens in zlib,
+    hashlib and file I/O, which release the GIL). Raises InventoryError listing the rows whose
+    images can't be used; blobs stored for an import that fails are left to the storage sweeper.
+    """
+    app = current_app._get_current_object()
+    members = set(archive.namelist()) if archive is not None else set()
+
+    def resolve(ref):
+        with app.app_context():
+            member = posixpath.normpath(posixpath.join(folder, ref))
+            try:
+                if member in members:
+                    with archive.open(member) as f:
+                        return base_url + store_stream(f, app.config["UPLOAD_MAX_FILE_SIZE"]), None
+                key = key_for(ref)
+                if key is not None and current_storage().exists(key):
+                    return f"{base_url}/images/{key}", None
+            except (ValueError, zipfile.BadZipFile) as e:   # UploadError, or a key escaping the store
+                return None, f"{ref}: {e}"
+            return None, f"{ref}: not in the zip file or the image store."
+
+    refs = list({ref for row in rows for ref in row["images"]})
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        resolved = dict(zip(refs, executor.map(resolve, refs)))
+
+    errors = {}
+    for i, row in enumerate(rows):
+        for ref in row["images"]:
+            if resolved[ref][1]:
+                errors.setdefault(i, resolved[ref][1])
+    _raise_for(errors, len(rows))
+    return [[resolved[ref][0] for ref in row["images"]] for row in rows]
+
+
+def _slug(title):
+    # As /api/add-product builds them.
+    slug = re.sub(r'[^a-zA-Z0-9\s-]', '', title).lower().replace(" ", "-")
+    return f"{slug}-{uuid.uuid4()}"
+
+
+def _rendered(urls):
+    """Dimensions and variants of blobs some listing already has rendered (see uploads.new_image)."""
+    rows = db.session.execute(
+        select(Image.path, Image.width, Image.height, Image.variants)
+        .where(Image.path.in_(urls), Image.variants.is_not(None))
+    ).all()
+    return {row.path: {"width": row.width, "height": row.height, "variants": row.variants} for row in rows}
+
+
+def insert_products(seller, records, image_urls, chunk_size):
+    """INSERT the products and images in chunks, one executemany per table and one commit per chunk.
+
+    Bulk INSERTs skip the session events, so the caches and the image pipeline are told here.
+    Returns (chunks, images).
+    """
+    extensions = current_app.extensions
+    chunks = images_added = 0
+    for start in range(0, len(records), chunk_size):
+        products, images = [], []
+        for record, urls in zip(records[start:start + chunk_size], image_urls[start:start + chunk_size]):
+            product_id = new_uuid()
+            products.append({**record, "id": product_id, "slug": _slug(record["title"]), "seller_id": seller.id})
+            images.extend({"id": new_uuid(), "product_id": product_id, "path": url} for url in urls)
+
+        rendered = _rendered({image["path"] for image in images}) if images else {}
+        for image in images:
+            image.update(rendered.get(image["path"], {}))   # keys left out stay NULL, not JSON null
+
+        db.session.execute(insert(Product), products)
+        if images:
+            db.session.execute(insert(Image), images)
+        db.session.commit()
+        chunks += 1
+        images_added += len(images)
+
+        if "response_cache" in extensions:
+            extensions["response_cache"].invalidate("products", "brands", f"seller:{seller.address}")
+        if "facet_cache" in extensions:
+            extensions["facet_cache"].invalidate()
+        if "image_pipeline" in extensions:
+            for image in images:
+                if "variants" not in image:
+                    extensions["image_pipeline"].submit(image["id"], image["path"])
+    return chunks, images_added
+
+
+def import_products(seller, file, base_url):
+    """Import a CSV, JSONL or zip file of products for ``seller``. Returns a dict of counts.
+
+    Nothing is stored unless every row is valid and every image usable; after that, products
+    go in IMPORT_CHUNK_SIZE at a time.
+    """
+    config = current_app.config
+    started = time.perf_counter()
+    rows, errors, archive, folder = read_file(file, config["IMPORT_MAX_ROWS"])
+    if not rows:
+        raise InventoryError("The file has no products.")
+    records = validate(rows, errors)
+    image_urls = store_images(rows, archive, folder, base_url, config["IMPORT_IMAGE_WORKERS"])
+    chunks, images = insert_products(seller, records, image_urls, config["IMPORT_CHUNK_SIZE"])
+    return {
+        "imported": len(records),
+        "images": images,
+        "chunks": chunks,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def export_products(seller_id, batch_size):
+    """Yield a seller's products as NDJSON lines, oldest first, loading ``batch_size`` at a time.
+
+    The lines are Product.to_dict(), which import_products reads back (images by URL, price by price_wei).
+    """
+    products = db.session.scalars(
+        select(Product)
+        .where(Product.seller_id == seller_id)
+        .options(*Product.serialization_options())
+        .order_by(Product.created_at, Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for product in products:
+        yield json.dumps(product.to_dict(), separators=(",", ":")) + "\n"
+
+
+class Inventory:
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["inventory"] = self
+
+        @app.cli.command("products-import")
+        @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+        @click.option("--address", required=True, help="Wallet address of the seller to list the products for.")
+        @click.option("--base-url", required=True,
+                      help="Public URL of this API (e.g. https://api.example.com), prefixed to image paths.")
+        def products_import_command(path, address, base_url):
+            """Import products from a CSV, JSONL or zip (manifest plus images) file."""
+            seller = app.extensions["identity_cache"].lookup(address)
+            if seller is None or not seller.is_seller:
+                raise click.ClickException(f"{address} is not a registered seller.")
+            with open(path, "rb") as file:
+                try:
+                    report = import_products(seller, file, base_url.rstrip("/"))
+                except InventoryError as e:
+                    for error in e.errors:
+                        click.echo(f"row {error['row']}: {error['error']}", err=True)
+                    raise click.ClickException(str(e))
+            app.extensions["image_pipeline"].wait()
+            for key, value in report.items():
+                click.echo(f"{key}: {value}")
+
+        @app.cli.command("products-export")
+        @click.argument("address")
+        @click.option("--output", "-o", default="-", show_default=True, help="File to write the NDJSON to.")
+        def products_export_command(address, output):
+            """Write a seller's products as NDJSON, one product per line."""
+            seller = app.extensions["identity_cache"].lookup(address)
+            if seller is None:
+                raise click.ClickException(f"{address} is not registered.")
+            with click.open_file(output, "w") as f:
+                for line in export_products(seller.id, app.config["EXPORT_BATCH_SIZE"]):
+                    f.write(line)
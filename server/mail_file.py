@@ -1,238 +1,138 @@
+import os
+import re
 from datetime import datetime
+from flask import current_app
 from flask_mail import Message
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
 
 
 CONTRACT_LINK = "https://sepolia.etherscan.io/address/0xca5c9a13495152AB6390d0A26715fF56db404B36"
-
-
-def send_transaction_mail(title, recipients, content, product):
+ACCOUNT_LINK = "https://multivendor-ethereum-marketplace.vercel.app/account"
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "mail")
+
+# Transaction status -> (event template, subject). "created" is sent by create-transaction.
+TRANSACTION_EVENTS = {
+    None: ("created", "Transaction %s has been initialized!"),
+    1: ("delivered", "Seller has delivered product in transaction %s"),
+    2: ("confirmed", "Buyer has confirmed receiving product in transaction %s"),
+    3: ("disputed", "Buyer has raised a dispute on transaction %s"),
+    4: ("cancelled", "Transaction %s cancelled!"),
+    5: ("finalized", "Transaction %s successful and finalized."),
+}
+
+# Templates are compiled once here and never reloaded; autoescaping covers names,
+# product titles and contact-form input.
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+env.globals["contract_link"] = CONTRACT_LINK
+env.globals["account_link"] = ACCOUNT_LINK
+
+for _name in env.list_templates(extensions=["html"]):
+    env.get_template(_name)
+
+# Text that never changes between messages (the layout with its CSS, and each event's buyer and
+# seller bodies, subject included) is rendered once with placeholders and split into the static
+# text around them, so a message only costs escaping its values and one join.
+_FIELD = re.compile("\x00(\\w+)\x00")
+
+
+def _slot(name):
+    return f"\x00{name}\x00"
+
+
+def _escape(value):
+    # markupsafe.escape's replacements, without building a Markup object for every value.
+    if isinstance(value, (int, float)):
+        return str(value)
+    return (str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&#34;").replace("'", "&#39;"))
+
+
+class _Page:
+    __slots__ = ("head", "fields")
+
+    def __init__(self, html):
+        parts = _FIELD.split(html)
+        self.head = parts[0]
+        self.fields = list(zip(parts[1::2], parts[2::2]))   # (field name, static text after it)
+
+    def fill(self, values):
+        """The page with each field replaced by values[field], which must already be escaped."""
+        out = [self.head]
+        for name, text in self.fields:
+            out.append(values[name])
+            out.append(text)
+        return "".join(out)
+
+
+with open(os.path.join(TEMPLATE_DIR, "style.css")) as f:
+    _CSS = Markup(f.read())
+_LAYOUT = _Page(env.get_template("layout.html").render(
+    css=_CSS, title=_slot("title"), body=Markup(_slot("body")), year=_slot("year")
+))
+
+
+def _transaction_page(event, subject, role):
+    title = subject % _slot("transaction_id")
+    module = env.get_template("transaction.html").make_module({
+        "title": title, "transaction_id": _slot("transaction_id"),
+        "product": {"title": _slot("product_title"), "price": _slot("product_price")},
+        "content": env.get_template(f"events/{event}.html").module,
+    })
+    body = module.body(role, _slot("first_name"))
+    return _Page(_LAYOUT.fill({"title": escape(title), "body": body, "year": _slot("year")}))
+
+
+# status -> (buyer's page, seller's page)
+_TRANSACTION_PAGES = {
+    status: (_transaction_page(event, subject, "buyer"), _transaction_page(event, subject, "seller"))
+    for status, (event, subject) in TRANSACTION_EVENTS.items()
+}
+
+
+def page(title, body):
+    return _LAYOUT.fill({"title": _escape(title), "body": body, "year": str(datetime.now().year)})
+
+
+def transaction_mails(transaction_id, product, buyer, seller, status=None):
+    """Build the buyer and seller emails for one transaction event from its precompiled pages."""
+    title = TRANSACTION_EVENTS[status][1] % (transaction_id,)
+    buyer_page, seller_page = _TRANSACTION_PAGES[status]
+    # Shared by both messages, so escaped once.
+    values = {
+        "transaction_id": _escape(transaction_id), "year": str(datetime.now().year),
+        "product_title": _escape(product.title), "product_price": _escape(product.price),
+    }
+    # Message() would look the default sender up through current_app for each message.
+    sender = current_app.extensions["mail"].default_sender
+    buyer_values = dict(values, first_name=_escape(buyer.name.split(" ")[0]))
+    values["first_name"] = _escape(seller.name.split(" ")[0])
+    return [
+        Message(title, recipients=[buyer.email], sender=sender, html=buyer_page.fill(buyer_values)),
+        Message(title, recipients=[seller.email], sender=sender, html=seller_page.fill(values)),
+    ]
+
+
+def contact_mail(title, recipients, name, email, phone, message):
     msg = Message(title, recipients=recipients)
-    msg.html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{title}</title>
-            <style>
-                body {{
-                    margin: 0;
-                    padding: 0;
-                    background-color: #f9fafb;
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    color: #1f2937;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 40px auto;
-                    background: #ffffff;
-                    padding: 40px;
-                    border-radius: 12px;
-                    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
-                }}
-                .brand {{
-                    display: flex;
-                    align-items: center;
-                    gap: 10px;
-                    margin-bottom: 30px;
-                    text-decoration: none;
-                    color: #1d4ed8;
-                    font-weight: 700;
-                    font-size: 24px;
-                }}
-                .title {{
-                    font-size: 20px;
-                    font-weight: 600;
-                    margin-bottom: 20px;
-                }}
-                .content {{
-                    font-size: 16px;
-                    line-height: 1.6;
-                    margin-bottom: 30px;
-                }}
-                .product {{
-                    background-color: #f3f4f6;
-                    padding: 20px;
-                    border-radius: 8px;
-                    font-size: 15px;
-                    margin-bottom: 30px;
-                }}
-                .product b {{
-                    display: inline-block;
-                    width: 80px;
-                }}
-                .footer {{
-                    text-align: center;
-                    font-size: 13px;
-                    color: #6b7280;
-                }}
-                a {{
-                    color: #1d4ed8;
-                    text-decoration: none;
-                }}
-                a:hover {{
-                    text-decoration: underline;
-                }}
-                @media (prefers-color-scheme: dark) {{
-                    body {{
-                        background-color: #111827;
-                        color: #f3f4f6;
-                    }}
-                    .container {{
-                        background-color: #1f2937;
-                    }}
-                    .brand-icon {{
-                        background-color: #fff;
-                        color: #000;
-                    }}
-                    .product {{
-                        background-color: #374151;
-                    }}
-                    .footer {{
-                        color: #9ca3af;
-                    }}
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="brand">
-                    <a href="/" class="brand-link">
-                        <div>Pyman</div>
-                    </a>
-                </div>
-
-                <div class="title">{title}</div>
-
-                <div class="content">
-                    {content}
-                </div>
-
-                <div class="product">
-                    <div><b>Title:</b> {product.title}</div>
-                    <div><b>Price:</b> {product.price} ETH</div>
-                    <div><b>Contract:</b> <a href="{CONTRACT_LINK}">View on Etherscan</a></div>
-                </div>
-
-                <div class="footer">
-                    <p>Pyman &copy; {datetime.now().year}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+    msg.html = page(title, env.get_template("contact.html").render(name=name, email=email, phone=phone, message=message))
     return msg
 
 
-def send_contact_email(title, recipients, content):
-    msg = Message(title, recipients=recipients)
-    msg.html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{title}</title>
-            <style>
-               body {{
-                    margin: 0;
-                    padding: 0;
-                    background-color: #f9fafb;
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    color: #1f2937;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 40px auto;
-                    background: #ffffff;
-                    padding: 40px;
-                    border-radius: 12px;
-                    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
-                }}
-                .brand {{
-                    display: flex;
-                    align-items: center;
-                    gap: 10px;
-                    margin-bottom: 30px;
-                    text-decoration: none;
-                    color: #1d4ed8;
-                    font-weight: 700;
-                    font-size: 24px;
-                }}
-                .title {{
-                    font-size: 20px;
-                    font-weight: 600;
-                    margin-bottom: 20px;
-                }}
-                .content {{
-                    font-size: 16px;
-                    line-height: 1.6;
-                    margin-bottom: 30px;
-                }}
-                .product {{
-                    background-color: #f3f4f6;
-                    padding: 20px;
-                    border-radius: 8px;
-                    font-size: 15px;
-                    margin-bottom: 30px;
-                }}
-                .product b {{
-                    display: inline-block;
-                    width: 80px;
-                }}
-                .footer {{
-                    text-align: center;
-                    font-size: 13px;
-                    color: #6b7280;
-                }}
-                a {{
-                    color: #1d4ed8;
-                    text-decoration: none;
-                }}
-                a:hover {{
-                    text-decoration: underline;
-                }}
-                @media (prefers-color-scheme: dark) {{
-                    body {{
-                        background-color: #111827;
-                        color: #f3f4f6;
-                    }}
-                    .container {{
-                        background-color: #1f2937;
-                    }}
-                    .brand-icon {{
-                        background-color: #fff;
-                        color: #000;
-                    }}
-                    .product {{
-                        background-color: #374151;
-                    }}
-                    .footer {{
-                        color: #9ca3af;
-                    }}
-                }}
-
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="brand">
-                    <a href="/" class="brand-link">
-                        <div>Pyman</div>
-                    </a>
-                </div>
-
-                <div class="content">
-                    {content}
-                </div>
-
-                <div class="footer">
-                    <p>Pyman &copy; {datetime.now().year}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+def welcome_mail(recipients):
+    msg = Message(subject="🎉 Signed Up!", recipients=recipients)
+    msg.html = page("Signed Up!", env.get_template("welcome.html").render())
     return msg
 
 
-
-
+def otp_mail(otp, recipients):
+    msg = Message("Pyman Ethereum Marketplace OTP", recipients=recipients)
+    msg.html = env.get_template("otp.html").render(otp=otp)
+    return msg
@@ -0,0 +1,176 @@
+import threading
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask_mail import Message
+from sqlalchemy import event, or_, and_, select, update
+
+from metrics import timed
+from models import db, OutboxMessage
+
+
+DEFAULTS = {
+    "MAIL_QUEUE_AUTOSTART": True,
+    "MAIL_QUEUE_WORKERS": 2,
+    "MAIL_QUEUE_BATCH_SIZE": 20,
+    "MAIL_QUEUE_POLL_INTERVAL": 5,       # seconds between polls when idle
+    "MAIL_QUEUE_MAX_ATTEMPTS": 6,        # then the message is dead-lettered
+    "MAIL_QUEUE_BACKOFF_BASE": 30,       # seconds; doubles after every failed attempt
+    "MAIL_QUEUE_CLAIM_TIMEOUT": 300,     # seconds before a batch claimed by a crashed worker is retried
+}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def enqueue(msg):
+    """Stage a flask_mail Message in the outbox.
+
+    The row is part of the caller's session, so it is only sent once the caller commits,
+    and nothing is sent if the request rolls back.
+    """
+    db.session.add(OutboxMessage(subject=msg.subject, recipients=list(msg.recipients), html=msg.html))
+
+
+class MailQueue:
+    def __init__(self, app=None, mail=None):
+        self.app = None
+        self.mail = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, mail)
+
+    def init_app(self, app, mail):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        self.mail = mail
+        app.extensions["mail_queue"] = self
+
+        # Wake the workers as soon as a commit containing new outbox rows lands.
+        @event.listens_for(db.session, "after_flush")
+        def _track_outbox(session, flush_context):
+            if any(isinstance(obj, OutboxMessage) for obj in session.new):
+                session.info["outbox_dirty"] = True
+
+        @event.listens_for(db.session, "after_commit")
+        def _notify_workers(session):
+            if session.info.pop("outbox_dirty", False):
+                self._wake.set()
+
+        @app.before_request
+        def _autostart():
+            if app.config["MAIL_QUEUE_AUTOSTART"] and not self._threads:
+                self.start()
+
+        @app.cli.command("mail-worker")
+        def mail_worker_command():
+            """Run the outbox worker in the foreground (use with MAIL_QUEUE_AUTOSTART=False)."""
+            self.run()
+
+        @app.cli.command("mail-requeue-dead")
+        def mail_requeue_dead_command():
+            """Give every dead-lettered message a fresh set of attempts."""
+            count = db.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.status == "dead")
+                .values(status="pending", attempts=0, next_attempt_at=_now(), claim_token=None)
+            ).rowcount
+            db.session.commit()
+            click.echo(f"Requeued {count} message(s).")
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.app.config["MAIL_QUEUE_WORKERS"]):
+                thread = threading.Thread(target=self.run, name=f"mail-queue-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    sent_any = self.process_batch()
+            except Exception as e:
+                self.app.logger.exception("Mail queue worker error: %s", e)
+                sent_any = False
+
+            if not sent_any:
+                self._wake.wait(self.app.config["MAIL_QUEUE_POLL_INTERVAL"])
+                self._wake.clear()
+
+    def process_batch(self):
+        """Claim one batch of due messages and send it over a single SMTP connection."""
+        batch = self._claim_batch()
+        if not batch:
+            return False
+
+        try:
+            with timed("smtp"), self.mail.connect() as conn:
+                for row in batch:
+                    try:
+                        conn.send(Message(row.subject, recipients=row.recipients, html=row.html))
+                    except Exception as e:
+                        self._record_failure(row, e)
+                    else:
+                        row.status = "sent"
+                        row.sent_at = _now()
+                        row.claim_token = None
+        except Exception as e:
+            # Could not connect (or the connection dropped on quit); retry whatever wasn't sent.
+            for row in batch:
+                if row.status == "sending":
+                    self._record_failure(row, e)
+
+        db.session.commit()
+        return True
+
+    def _claim_batch(self):
+        config = self.app.config
+        now = _now()
+        due = or_(
+            and_(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now),
+            and_(OutboxMessage.status == "sending",
+                 OutboxMessage.claimed_at <= now - timedelta(seconds=config["MAIL_QUEUE_CLAIM_TIMEOUT"])),
+        )
+        ids = db.session.scalars(
+            select(OutboxMessage.id).where(due).order_by(OutboxMessage.id).limit(config["MAIL_QUEUE_BATCH_SIZE"])
+        ).all()
+        if not ids:
+            db.session.rollback()
+            return []
+
+        # Re-checking `due` in the UPDATE makes the claim atomic across threads and processes.
+        token = uuid.uuid4().hex
+        db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids), due)
+            .values(status="sending", claim_token=token, claimed_at=now)
+        )
+        db.session.commit()
+        return OutboxMessage.query.filter_by(claim_token=token).order_by(OutboxMessage.id).all()
+
+    def _record_failure(self, row, error):
+        config = self.app.config
+        row.attempts += 1
+        row.last_error = str(error)
+        row.claim_token = None
+        if row.attempts >= config["MAIL_QUEUE_MAX_ATTEMPTS"]:
+            row.status = "dead"
+            self.app.logger.error("Mail %s dead-lettered after %s attempts: %s", row.id, row.attempts, error)
+        else:
+            delay = config["MAIL_QUEUE_BACKOFF_BASE"] * 2 ** (row.attempts - 1)
+            row.status = "pending"
+            row.next_attempt_at = _now() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
@@ -0,0 +1,244 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from web3.middleware import Web3Middleware
+
+
+DEFAULTS = {
+    "METRICS_ENABLED": True,
+    "METRICS_PATH": "/metrics",   # keep it off the public proxy; Prometheus scrapes each worker directly
+    "METRICS_BUCKETS": (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),   # seconds
+    "METRICS_QUERY_BUCKETS": (1, 2, 3, 5, 10, 20, 50, 100, 250),
+    # Sampling profiler: off unless asked for, since it walks every request thread's stack.
+    "PROFILER_ENABLED": os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true"),
+    "PROFILER_INTERVAL": 0.005,       # seconds between samples
+    "PROFILER_SLOW_REQUEST": float(os.getenv("PROFILER_SLOW_REQUEST", 1.0)),   # seconds; faster requests are discarded
+    "PROFILER_DIR": os.getenv("PROFILER_DIR"),   # defaults to <instance>/profiles
+}
+
+# Where a request's time goes besides Python: set up by the hooks below and by timed() blocks.
+KINDS = ("sql", "smtp", "rpc", "io")
+
+_local = threading.local()   # .spent ({kind: seconds}) and .queries of the request on this thread
+
+
+@contextmanager
+def timed(kind):
+    """Charge the time spent in the block to ``kind`` for the current request (or background work)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - started)
+
+
+def record(kind, seconds):
+    spent = getattr(_local, "spent", None)
+    if spent is not None:
+        spent[kind] += seconds
+    elif has_app_context() and "metrics" in current_app.extensions:
+        # Outside a request: the mail workers, the indexer and the CLI.
+        current_app.extensions["metrics"].observe_work(kind, seconds)
+
+
+class RPCTimer(Web3Middleware):
+    """web3 middleware timing every JSON-RPC round trip, single or batched."""
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            with timed("rpc"):
+                return make_request(method, params)
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            with timed("rpc"):
+                return make_batch_request(requests_info)
+        return middleware
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}   # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ",".join(f'{name}="{value}"' for name, value in key)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{labels + ',' if labels else ''}{le}}} {cumulative}")
+            labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Sampler:
+    """Samples the stacks of the threads serving requests, for requests that turn out slow.
+
+    Stacks are written in the folded format (``root;caller;callee count`` per line) that
+    flamegraph.pl, speedscope and inferno read.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stacks = {}   # thread id -> Counter of folded stacks
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def watch(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+                self._thread.start()
+        self._stacks[threading.get_ident()] = Counter()
+
+    def unwatch(self):
+        return self._stacks.pop(threading.get_ident(), None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, stacks in list(self._stacks.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Metrics:
+    """Per-route request timings, exposed as Prometheus histograms.
+
+    For every request it records the wall time, the number and total time of SQL queries and
+    the time spent on RPC, SMTP and file I/O (see timed()). Each worker process keeps its own
+    numbers; Prometheus sums them across the scraped workers.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.sampler = None
+        self.requests = self.queries = self.spent = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        app.extensions["metrics"] = self
+        config = app.config
+        if not config["METRICS_ENABLED"]:
+            return
+
+        self.requests = Histogram("http_request_duration_seconds", "Wall time per request.", config["METRICS_BUCKETS"])
+        self.queries = Histogram("http_request_sql_queries", "SQL statements per request.", config["METRICS_QUERY_BUCKETS"])
+        self.spent = Histogram("http_request_io_seconds", "Time per request spent on sql, rpc, smtp and file io; "
+                               'route="background" is work done outside requests.', config["METRICS_BUCKETS"])
+        if config["PROFILER_ENABLED"]:
+            self.sampler = Sampler(config["PROFILER_INTERVAL"])
+
+        @event.listens_for(Engine, "before_cursor_execute")
+        def _query_started(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(Engine, "after_cursor_execute")
+        def _query_finished(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.get("query_started")
+            if started:
+                record("sql", time.perf_counter() - started.pop())
+            if getattr(_local, "spent", None) is not None:
+                _local.queries += 1
+
+        @app.before_request
+        def _start_request():
+            _local.spent = dict.fromkeys(KINDS, 0.0)
+            _local.queries = 0
+            g.request_started = time.perf_counter()
+            if self.sampler:
+                self.sampler.watch()
+
+        @app.after_request
+        def _finish_request(response):
+            self.observe_request(response.status_code)
+            return response
+
+        # Requests aborted before after_request ran (e.g. a client disconnect) must not leak their counters.
+        @app.teardown_request
+        def _clear_request(exc):
+            _local.spent = None
+            if self.sampler:
+                self.sampler.unwatch()
+
+        app.add_url_rule(config["METRICS_PATH"], "metrics", self.render)
+
+    def observe_request(self, status):
+        spent = _local.spent
+        if spent is None or request.endpoint == "metrics":
+            return
+        seconds = time.perf_counter() - g.request_started
+        route = request.url_rule.rule if request.url_rule else "unmatched"   # not the raw path: one series per route
+        self.requests.observe(seconds, route=route, method=request.method, status=str(status))
+        self.queries.observe(_local.queries, route=route)
+        for kind, value in spent.items():
+            self.spent.observe(value, route=route, kind=kind)
+        _local.spent = None
+
+        if self.sampler:
+            stacks = self.sampler.unwatch()
+            if stacks and seconds >= self.app.config["PROFILER_SLOW_REQUEST"]:
+                self.dump_profile(stacks, seconds)
+
+    def observe_work(self, kind, seconds):
+        if self.spent is not None:
+            self.spent.observe(seconds, route="background", kind=kind)
+
+    def dump_profile(self, stacks, seconds):
+        folder = self.app.config["PROFILER_DIR"] or os.path.join(self.app.instance_path, "profiles")
+        os.makedirs(folder, exist_ok=True)
+        name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint or 'unmatched'}-{seconds * 1000:.0f}ms.folded"
+        with open(os.path.join(folder, name), "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.app.logger.info("Profiled a %.0f ms %s %s: %s", seconds * 1000, request.method, request.path, name)
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.queries, self.spent):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
@@ -0,0 +1,34 @@
+"""The SQLite full-text index over products (see 0005), shared by the migrations that touch it.
+
+Batch mode changes a SQLite table by copying it into a new one, which drops the table's triggers and
+renumbers its rowids, so a migration that rebuilds products calls restore_triggers() afterwards.
+Revisions that already shipped run these statements too: change them only together with a new
+revision that brings existing databases along.
+"""
+from alembic import op
+
+
+TRIGGERS = [
+    """CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, title, brand, model, description)
+        VALUES (new.rowid, new.title, new.brand, new.model, new.description);
+    END""",
+    """CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, title, brand, model, description)
+        VALUES ('delete', old.rowid, old.title, old.brand, old.model, old.description);
+    END""",
+    """CREATE TRIGGER products_fts_au AFTER UPDATE OF title, brand, model, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, title, brand, model, description)
+        VALUES ('delete', old.rowid, old.title, old.brand, old.model, old.description);
+        INSERT INTO products_fts(rowid, title, brand, model, description)
+        VALUES (new.rowid, new.title, new.brand, new.model, new.description);
+    END""",
+]
+
+# Reindexes every product from the products table, under whatever rowids it has now.
+REBUILD = "INSERT INTO products_fts(products_fts) VALUES ('rebuild')"
+
+
+def restore_triggers():
+    for statement in [*TRIGGERS, REBUILD]:
+        op.execute(statement)
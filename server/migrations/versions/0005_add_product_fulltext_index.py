@@ -0,0 +1,59 @@
+"""add product full-text index
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 09:20:11.482913
+
+"""
+from alembic import op
+
+from migrations import fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    # External-content FTS5 table: the text lives in products, the index is kept in sync by triggers.
+    """CREATE VIRTUAL TABLE products_fts USING fts5(
+        title, brand, model, description,
+        content='products', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    *fts.TRIGGERS,
+    fts.REBUILD,
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS products_fts_au",
+    "DROP TRIGGER IF EXISTS products_fts_ad",
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    "DROP TABLE IF EXISTS products_fts",
+]
+
+POSTGRES_DOCUMENT = (
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(brand, '') || ' ' "
+    "|| coalesce(model, '') || ' ' || coalesce(description, ''))"
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute(f"CREATE INDEX ix_products_fulltext ON products USING gin ({POSTGRES_DOCUMENT})")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_products_fulltext")
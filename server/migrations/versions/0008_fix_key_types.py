@@ -0,0 +1,248 @@
+"""fix key types and link transaction parties
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 09:39:17.068492
+
+On SQLite the keys are converted row by row in Python and the tables rebuilt; on PostgreSQL
+the columns are converted in place with USING casts (0001 already gave images.product_id and
+wishlists.user_id their referenced column's type there).
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from migrations import fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+# models.CompactUUID as SQLite and PostgreSQL store it.
+UUID_KEY = sa.LargeBinary(length=16)
+POSTGRES_UUID_KEY = postgresql.UUID(as_uuid=False)
+
+# Foreign keys to products.id, dropped on PostgreSQL while the key changes type (named as
+# PostgreSQL named them in 0001).
+PRODUCT_FOREIGN_KEYS = [
+    ('images_product_id_fkey', 'images'),
+    ('transactions_product_id_fkey', 'transactions'),
+    ('wishlists_product_id_fkey', 'wishlists'),
+]
+
+# (table, uuid columns) converted between text and 16-byte keys; every table is keyed by id.
+UUID_COLUMNS = [
+    ('products', ['id']),
+    ('images', ['id', 'product_id']),
+    ('wishlists', ['product_id']),
+    ('transactions', ['product_id']),
+]
+
+
+def _year(value):
+    value = str(value).strip() if value is not None else ''
+    return int(value) if value.isdigit() else None
+
+
+def _convert_keys(bind, to_bytes):
+    # Row by row in Python: SQLite 3.40 has no unhex(), and this also validates every key.
+    convert = (lambda v: uuid.UUID(v).bytes) if to_bytes else (lambda v: str(uuid.UUID(bytes=v)))
+    for table, columns in UUID_COLUMNS:
+        rows = bind.execute(sa.text(f"SELECT {', '.join(dict.fromkeys(['id', *columns]))} FROM {table}")).mappings()
+        updates = []
+        for row in rows:
+            try:
+                updates.append({"key": row["id"], **{f"new_{c}": convert(row[c]) for c in columns}})
+            except (ValueError, TypeError, AttributeError):
+                raise RuntimeError(f"{table} row {row['id']!r} has a malformed key: {dict(row)}")
+        if updates:
+            assignments = ", ".join(f"{column} = :new_{column}" for column in columns)
+            bind.execute(sa.text(f"UPDATE {table} SET {assignments} WHERE id = :key"), updates)
+
+
+def _using(bind, cast):
+    # alter_column options: how PostgreSQL converts the existing values; SQLite copies them as they are.
+    return {'postgresql_using': cast} if bind.dialect.name == 'postgresql' else {}
+
+
+def upgrade():
+    bind = op.get_bind()
+    is_postgresql = bind.dialect.name == 'postgresql'
+    key_type = POSTGRES_UUID_KEY if is_postgresql else UUID_KEY
+
+    # Transaction parties become users. create-transaction always required both to be registered,
+    # so every address should resolve; stop rather than lose a transaction if one doesn't.
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seller_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('buyer_id', sa.Integer(), nullable=True))
+    op.execute("""UPDATE transactions SET
+        seller_id = (SELECT users.id FROM users WHERE users.address = transactions.seller),
+        buyer_id = (SELECT users.id FROM users WHERE users.address = transactions.buyer)""")
+    orphans = bind.execute(sa.text(
+        "SELECT transaction_id, seller, buyer FROM transactions WHERE seller_id IS NULL OR buyer_id IS NULL"
+    )).all()
+    if orphans:
+        raise RuntimeError(f"Transactions with unregistered parties, register them first: {orphans}")
+
+    # add-wishlist never checked the product, so a wishlist may point at nothing; those rows go.
+    op.execute("DELETE FROM wishlists WHERE product_id NOT IN (SELECT id FROM products)")
+    if is_postgresql:
+        for name, table in PRODUCT_FOREIGN_KEYS:
+            op.drop_constraint(name, table, type_='foreignkey')
+    else:
+        _convert_keys(bind, to_bytes=True)
+        years = bind.execute(sa.text("SELECT id, year FROM products WHERE year IS NOT NULL")).all()
+        if years:
+            bind.execute(sa.text("UPDATE products SET year = :year WHERE id = :id"),
+                         [{"id": id, "year": _year(year)} for id, year in years])
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.alter_column('id',
+               existing_type=sa.VARCHAR(length=250),
+               type_=key_type,
+               existing_nullable=False,
+               **_using(bind, 'id::uuid'))
+        batch_op.alter_column('year',
+               existing_type=sa.VARCHAR(length=250),
+               type_=sa.Integer(),
+               existing_nullable=True,
+               **_using(bind, "CASE WHEN trim(year) ~ '^[0-9]+$' THEN trim(year)::integer END"))
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.alter_column('id',
+               existing_type=sa.VARCHAR(length=250),
+               type_=key_type,
+               existing_nullable=False,
+               **_using(bind, 'id::uuid'))
+        batch_op.alter_column('product_id',
+               existing_type=sa.VARCHAR(length=250) if is_postgresql else sa.INTEGER(),
+               type_=key_type,
+               existing_nullable=False,
+               **_using(bind, 'product_id::uuid'))
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.alter_column('seller_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('buyer_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('product_id',
+               existing_type=sa.VARCHAR(length=250),
+               type_=key_type,
+               existing_nullable=False,
+               **_using(bind, 'product_id::uuid'))
+        batch_op.drop_index('ix_transactions_buyer_created_at')
+        batch_op.drop_index('ix_transactions_seller_created_at')
+        batch_op.create_index('ix_transactions_buyer_id_created_at', ['buyer_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_transactions_seller_id_created_at', ['seller_id', 'created_at'], unique=False)
+        batch_op.create_foreign_key('fk_transactions_buyer_id_users', 'users', ['buyer_id'], ['id'])
+        batch_op.create_foreign_key('fk_transactions_seller_id_users', 'users', ['seller_id'], ['id'])
+        batch_op.drop_column('seller')
+        batch_op.drop_column('buyer')
+
+    with op.batch_alter_table('wishlists', schema=None) as batch_op:
+        if not is_postgresql:
+            batch_op.alter_column('user_id',
+                   existing_type=sa.VARCHAR(length=250),
+                   type_=sa.Integer(),
+                   existing_nullable=False)
+        batch_op.alter_column('product_id',
+               existing_type=sa.VARCHAR(length=250),
+               type_=key_type,
+               existing_nullable=False,
+               **_using(bind, 'product_id::uuid'))
+
+    if is_postgresql:
+        for name, table in PRODUCT_FOREIGN_KEYS:
+            op.create_foreign_key(name, table, 'products', ['product_id'], ['id'], ondelete='CASCADE')
+    else:
+        # Rebuilding the products table dropped its triggers and renumbered its rowids.
+        fts.restore_triggers()
+
+
+def downgrade():
+    bind = op.get_bind()
+    is_postgresql = bind.dialect.name == 'postgresql'
+    key_type = POSTGRES_UUID_KEY if is_postgresql else UUID_KEY
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seller', sa.VARCHAR(length=250), nullable=True))
+        batch_op.add_column(sa.Column('buyer', sa.VARCHAR(length=250), nullable=True))
+    op.execute("""UPDATE transactions SET
+        seller = (SELECT users.address FROM users WHERE users.id = transactions.seller_id),
+        buyer = (SELECT users.address FROM users WHERE users.id = transactions.buyer_id)""")
+
+    if is_postgresql:
+        image_products = []
+        for name, table in PRODUCT_FOREIGN_KEYS:
+            op.drop_constraint(name, table, type_='foreignkey')
+    else:
+        _convert_keys(bind, to_bytes=False)
+        # Going back to INTEGER, the table copy would CAST these to numbers; they are put back afterwards.
+        image_products = bind.execute(sa.text("SELECT id, product_id FROM images")).all()
+
+    with op.batch_alter_table('wishlists', schema=None) as batch_op:
+        batch_op.alter_column('product_id',
+               existing_type=key_type,
+               type_=sa.VARCHAR(length=250),
+               existing_nullable=False,
+               **_using(bind, 'product_id::text'))
+        if not is_postgresql:
+            batch_op.alter_column('user_id',
+                   existing_type=sa.Integer(),
+                   type_=sa.VARCHAR(length=250),
+                   existing_nullable=False)
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_transactions_seller_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_transactions_buyer_id_users', type_='foreignkey')
+        batch_op.drop_index('ix_transactions_seller_id_created_at')
+        batch_op.drop_index('ix_transactions_buyer_id_created_at')
+        batch_op.alter_column('seller', existing_type=sa.VARCHAR(length=250), nullable=False)
+        batch_op.alter_column('buyer', existing_type=sa.VARCHAR(length=250), nullable=False)
+        batch_op.create_index('ix_transactions_seller_created_at', ['seller', 'created_at'], unique=False)
+        batch_op.create_index('ix_transactions_buyer_created_at', ['buyer', 'created_at'], unique=False)
+        batch_op.alter_column('product_id',
+               existing_type=key_type,
+               type_=sa.VARCHAR(length=250),
+               existing_nullable=False,
+               **_using(bind, 'product_id::text'))
+        batch_op.drop_column('buyer_id')
+        batch_op.drop_column('seller_id')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.alter_column('year',
+               existing_type=sa.Integer(),
+               type_=sa.VARCHAR(length=250),
+               existing_nullable=True,
+               **_using(bind, 'year::text'))
+        batch_op.alter_column('id',
+               existing_type=key_type,
+               type_=sa.VARCHAR(length=250),
+               existing_nullable=False,
+               **_using(bind, 'id::text'))
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.alter_column('product_id',
+               existing_type=key_type,
+               type_=sa.VARCHAR(length=250) if is_postgresql else sa.INTEGER(),
+               existing_nullable=False,
+               **_using(bind, 'product_id::text'))
+        batch_op.alter_column('id',
+               existing_type=key_type,
+               type_=sa.VARCHAR(length=250),
+               existing_nullable=False,
+               **_using(bind, 'id::text'))
+    if image_products:
+        bind.execute(sa.text("UPDATE images SET product_id = :product_id WHERE id = :id"),
+                     [{"id": id, "product_id": product_id} for id, product_id in image_products])
+
+    if is_postgresql:
+        for name, table in PRODUCT_FOREIGN_KEYS:
+            op.create_foreign_key(name, table, 'products', ['product_id'], ['id'], ondelete='CASCADE')
+    else:
+        # Rebuilding the products table dropped its triggers and renumbered its rowids.
+        fts.restore_triggers()
@@ -0,0 +1,85 @@
+"""store money as integer gwei
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 10:02:41.519307
+
+"""
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations import fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+GWEI_PER_ETH = 10 ** 9
+
+# (table, float ETH column, integer gwei column)
+MONEY_COLUMNS = [
+    ('products', 'price', 'price_gwei'),
+    ('transactions', 'amount', 'amount_gwei'),
+]
+
+
+def _to_gwei(table, id, eth):
+    # repr() is the shortest decimal that reads back as the same float, i.e. what was typed in.
+    gwei = Decimal(repr(float(eth))) * GWEI_PER_ETH
+    if gwei != gwei.to_integral_value():
+        raise RuntimeError(f"{table} row {id!r}: {eth!r} ETH has more than 9 decimals and can't be kept exactly.")
+    return int(gwei)
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, eth_column, gwei_column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(gwei_column, sa.BigInteger(), nullable=True))
+        rows = bind.execute(sa.text(f"SELECT id, {eth_column} FROM {table}")).all()
+        if rows:
+            bind.execute(sa.text(f"UPDATE {table} SET {gwei_column} = :gwei WHERE id = :id"),
+                         [{"id": id, "gwei": _to_gwei(table, id, eth)} for id, eth in rows])
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.alter_column('price_gwei', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_products_price_gwei'), ['price_gwei'], unique=False)
+        batch_op.drop_column('price')
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.alter_column('amount_gwei', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.drop_column('amount')
+
+    if bind.dialect.name == 'sqlite':
+        # Rebuilding the products table dropped its triggers and renumbered its rowids.
+        fts.restore_triggers()
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, eth_column, gwei_column in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(eth_column, sa.FLOAT(), nullable=True))
+        rows = bind.execute(sa.text(f"SELECT id, {gwei_column} FROM {table}")).all()
+        if rows:
+            bind.execute(sa.text(f"UPDATE {table} SET {eth_column} = :eth WHERE id = :id"),
+                         [{"id": id, "eth": gwei / GWEI_PER_ETH} for id, gwei in rows])
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.alter_column('amount', existing_type=sa.FLOAT(), nullable=False)
+        batch_op.drop_column('amount_gwei')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.alter_column('price', existing_type=sa.FLOAT(), nullable=False)
+        batch_op.drop_index(batch_op.f('ix_products_price_gwei'))
+        batch_op.drop_column('price_gwei')
+
+    if bind.dialect.name == 'sqlite':
+        # Rebuilding the products table dropped its triggers and renumbered its rowids.
+        fts.restore_triggers()
@@ -0,0 +1,37 @@
+"""add product wishlist counts
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 09:56:21.097523
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations import fts
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Adding a column is a plain ALTER TABLE, even in batch mode; the table and its triggers stay.
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('wishlist_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("""UPDATE products SET wishlist_count =
+        (SELECT COUNT(*) FROM wishlists WHERE wishlists.product_id = products.id)""")
+
+
+def downgrade():
+    bind = op.get_bind()
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('wishlist_count')
+
+    if bind.dialect.name == 'sqlite':
+        # Dropping the column rebuilt the products table, which dropped its triggers.
+        fts.restore_triggers()
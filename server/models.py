@@ -1,17 +1,53 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import selectinload, joinedload
 from datetime import datetime, timezone
 import uuid
 
+from money import gwei_to_eth, gwei_to_wei
+
 db = SQLAlchemy()
 
 
+class CompactUUID(db.TypeDecorator):
+    """A UUID key: a str in Python, 16 raw bytes in SQLite and a native uuid in PostgreSQL.
+
+    Strings that aren't UUIDs bind as NULL, so looking one up simply finds nothing.
+    """
+    impl = db.LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(db.LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            value = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+        except ValueError:
+            return None
+        return str(value) if dialect.name == 'postgresql' else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(value) if dialect.name == 'postgresql' else str(uuid.UUID(bytes=value))
+
+
+def new_uuid():
+    return str(uuid.uuid4())
+
+
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(250), nullable=False, unique=True)
     name = db.Column(db.String(250), nullable=False)
-    address = db.Column(db.String(250), nullable=False, unique=True)
+    address = db.Column(db.String(250), nullable=False, unique=True)  # always stored lowercased
     is_seller = db.Column(db.Boolean, default=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
@@ -28,19 +64,21 @@ class User(db.Model, UserMixin):
 
 class Product(db.Model):
     __tablename__ = 'products'
-    id = db.Column(db.String(250), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(CompactUUID, primary_key=True, default=new_uuid)
     title = db.Column(db.String(200), nullable=False)
     brand = db.Column(db.String(250))
     model = db.Column(db.String(250))
-    slug = db.Column(db.String(500), nullable=False)
+    slug = db.Column(db.String(500), nullable=False, unique=True, index=True)
     fuel_type = db.Column(db.String(250))
     transmission = db.Column(db.String(250))
     vehicle_type = db.Column(db.String(250))
-    year = db.Column(db.String(250))
+    year = db.Column(db.Integer)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)    
+    price_gwei = db.Column(db.BigInteger, nullable=False, index=True)   # see money.py
     mileage = db.Column(db.Integer, nullable=False)
     has_transaction = db.Column(db.Boolean, default=False, nullable=False)
+    # Kept up to date by the wishlist routes, so "N people saved this" never needs a COUNT(*).
+    wishlist_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     images = db.relationship('Image', backref='product',
@@ -49,6 +87,16 @@ class Product(db.Model):
     seller_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
     seller = db.relationship('User', back_populates='products')
 
+    __table_args__ = (
+        db.Index('ix_products_created_at', 'created_at'),
+        db.Index('ix_products_seller_id_created_at', 'seller_id', 'created_at'),
+    )
+
+    @property
+    def price(self):
+        # ETH for JSON and emails; filter and compare on price_gwei.
+        return gwei_to_eth(self.price_gwei)
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -62,28 +110,63 @@ class Product(db.Model):
             "year": self.year,
             "description": self.description,
             "price": self.price,
+            "price_wei": str(gwei_to_wei(self.price_gwei)),   # exact; JSON numbers aren't past 2**53
             "mileage": self.mileage,
             "images": [image.path for image in self.images],
+            "image_variants": [image.to_dict() for image in self.images],
             "seller_name": self.seller.name,
             "seller_address": self.seller.address,
             "has_transaction": self.has_transaction,
+            "wishlist_count": self.wishlist_count,
         }
+
+    @staticmethod
+    def serialization_options():
+        # Everything to_dict touches, loaded for a whole result set in two extra queries at most.
+        return (selectinload(Product.images), joinedload(Product.seller))
     
     
 class Image(db.Model):
     __tablename__ = 'images'
-    id = db.Column(db.String(250), primary_key=True, default=lambda: str(uuid.uuid4()))
-    path = db.Column(db.Text, nullable=False)
+    id = db.Column(CompactUUID, primary_key=True, default=new_uuid)
+    path = db.Column(db.Text, nullable=False, index=True)
+    # Filled in by the image pipeline once the variants are rendered (see images.py).
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    variants = db.Column(db.JSON)   # [{"name", "format", "width", "height", "file"}]
+
+    product_id = db.Column(CompactUUID, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
 
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    # Most preferred first; browsers pick the first <source> type they can decode.
+    MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+    def to_dict(self):
+        folder = self.path.rsplit('/', 1)[0]
+        srcsets = {}
+        sizes = {}
+        for variant in self.variants or []:
+            url = f"{folder}/{variant['file']}"
+            srcsets.setdefault(variant["format"], []).append(f"{url} {variant['width']}w")
+            sizes.setdefault(variant["name"], url)
+
+        sources = [{"type": mime, "srcset": ", ".join(srcsets[fmt])} for fmt, mime in self.MIME_TYPES.items() if fmt in srcsets]
+        return {
+            "src": self.path,
+            "width": self.width,
+            "height": self.height,
+            # A plain <img srcset> gets the most widely supported format; <picture> can use all sources.
+            "srcset": sources[-1]["srcset"] if sources else None,
+            "sources": sources,
+            **sizes,
+        }
 
 
 class Wishlist(db.Model):
     __tablename__ = 'wishlists'
     id = db.Column(db.Integer, primary_key=True)
 
-    user_id = db.Column(db.String(250), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
-    product_id = db.Column(db.String(250), db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(CompactUUID, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
 
     user = db.relationship('User', backref=db.backref('wishlists', lazy=True, cascade='all, delete-orphan'))
     product = db.relationship('Product', backref=db.backref('wishlisted_in', lazy=True, cascade='all, delete-orphan'))
@@ -98,16 +181,23 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
 
-    transaction_id = db.Column(db.Integer, nullable=False)
-    product_id = db.Column(db.String(250), db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
-    seller = db.Column(db.String(250), nullable=False)
-    buyer = db.Column(db.String(250), nullable=False)
-    amount = db.Column(db.Float, nullable=False)  
+    transaction_id = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(CompactUUID, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    seller_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    amount_gwei = db.Column(db.BigInteger, nullable=False)
     status = db.Column(db.Integer, nullable=False, default=0)
     
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     product = db.relationship('Product', backref='transactions', lazy=True)
+    seller = db.relationship('User', foreign_keys=[seller_id])
+    buyer = db.relationship('User', foreign_keys=[buyer_id])
+
+    __table_args__ = (
+        db.Index('ix_transactions_buyer_id_created_at', 'buyer_id', 'created_at'),
+        db.Index('ix_transactions_seller_id_created_at', 'seller_id', 'created_at'),
+    )
 
     status_mapping = {0: "Pending", 1: "Delivered", 2: "Confirmed", 3: "Disputed", 4: "Cancelled", 5: "Finalized"}
 
@@ -115,9 +205,10 @@ class Transaction(db.Model):
         return {
             "transaction_id": self.transaction_id,
             "product_id": self.product_id,
-            "seller": self.seller,
-            "buyer": self.buyer,
-            "amount": self.amount,
+            "seller": self.seller.address,
+            "buyer": self.buyer.address,
+            "amount": gwei_to_eth(self.amount_gwei),
+            "amount_wei": str(gwei_to_wei(self.amount_gwei)),
             "status": Transaction.status_mapping[self.status],
             "status_num": self.status,
             "image": self.product.images[0].path,
@@ -125,5 +216,52 @@ class Transaction(db.Model):
             "created_at": self.created_at
         }
 
+    @staticmethod
+    def serialization_options():
+        return (
+            selectinload(Transaction.product).selectinload(Product.images),
+            joinedload(Transaction.seller),
+            joinedload(Transaction.buyer),
+        )
 
 
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+
+    subject = db.Column(db.String(500), nullable=False)
+    recipients = db.Column(db.JSON, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    claim_token = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class ChainCheckpoint(db.Model):
+    __tablename__ = 'chain_checkpoints'
+    name = db.Column(db.String(100), primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False)
+    block_hash = db.Column(db.String(66), nullable=False)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
+
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(250), primary_key=True, default=lambda: str(uuid.uuid4()))
+    address = db.Column(db.String(250), nullable=False, index=True)   # the seller who opened it
+    filename = db.Column(db.String(250))
+    size = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.Text)   # /images URL path of the stored blob, once every byte has arrived
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
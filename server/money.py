@@ -0,0 +1,46 @@
+from decimal import Decimal, InvalidOperation
+
+
+# Prices and amounts are stored as integer gwei. Wei would be exact down to the last unit, but a
+# 64-bit SQLite integer only holds 9.2 ETH of it; gwei holds 9.2 billion ETH. Amounts are
+# validated to have at most 9 decimals, so nothing is ever rounded.
+GWEI_PER_ETH = 10 ** 9
+WEI_PER_GWEI = 10 ** 9
+
+
+class MoneyError(ValueError):
+    pass
+
+
+def eth_to_gwei(value):
+    """Parse an ETH amount from a form, query string or JSON ("1.5" or 1.5) into integer gwei, exactly."""
+    try:
+        eth = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise MoneyError(f"{value!r} is not an ETH amount.")
+    if not eth.is_finite() or eth < 0:
+        raise MoneyError(f"{value!r} is not an ETH amount.")
+    gwei = eth * GWEI_PER_ETH
+    if gwei != gwei.to_integral_value():
+        raise MoneyError("ETH amounts can have at most 9 decimals.")
+    return int(gwei)
+
+
+def wei_to_gwei(value):
+    """Integer gwei for a wei amount (an int from the chain, or its decimal string)."""
+    try:
+        wei = int(value)
+    except (TypeError, ValueError):
+        raise MoneyError(f"{value!r} is not a wei amount.")
+    if wei < 0 or wei % WEI_PER_GWEI:
+        raise MoneyError("Wei amounts must be non-negative whole gwei.")
+    return wei // WEI_PER_GWEI
+
+
+def gwei_to_eth(gwei):
+    # For JSON and display only; compare amounts as integers.
+    return gwei / GWEI_PER_ETH
+
+
+def gwei_to_wei(gwei):
+    return gwei * WEI_PER_GWEI
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from sqlalchemy import select, update
+from web3.exceptions import ProviderConnectionError, Web3RPCError
+
+from models import db, Transaction
+from contract import web3, read_transactions, RPC_BATCH_SIZE
+
+
+MAX_WORKERS = 32
+# The node or the network failing; anything else raised during a run is a bug.
+RPC_ERRORS = (Web3RPCError, ProviderConnectionError, requests.exceptions.RequestException)
+
+
+def reconcile_transactions(workers=8, dry_run=False):
+    """Bring every transactions.status in line with the contract's `transactions(id)` mapping.
+
+    All reads are pinned to one block and issued as JSON-RPC batches of RPC_BATCH_SIZE calls,
+    `workers` batches in flight at a time. The chain is the source of truth here, so statuses
+    can move backwards too. Returns a dict of counts and throughput for the run.
+    """
+    started = time.perf_counter()
+    rows = db.session.execute(select(Transaction.id, Transaction.transaction_id, Transaction.status)).all()
+    transaction_ids = sorted({row.transaction_id for row in rows})
+    block = web3.eth.block_number
+
+    chunks = [transaction_ids[i:i + RPC_BATCH_SIZE] for i in range(0, len(transaction_ids), RPC_BATCH_SIZE)]
+    onchain = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for result in executor.map(lambda chunk: read_transactions(chunk, block=block), chunks):
+            onchain.update(result)
+    read_seconds = time.perf_counter() - started
+
+    corrections = []
+    missing = []
+    for row in rows:
+        state = onchain.get(row.transaction_id)
+        if state is None or not state["exists"]:
+            missing.append(row.transaction_id)
+        elif state["status"] != row.status:
+            corrections.append({"id": row.id, "status": state["status"]})
+
+    if corrections and not dry_run:
+        db.session.execute(update(Transaction), corrections)
+        db.session.commit()
+
+    seconds = time.perf_counter() - started
+    return {
+        "block": block,
+        "checked": len(transaction_ids),
+        "corrected": len(corrections),
+        "missing_on_chain": missing,
+        "dry_run": dry_run,
+        "rpc_batches": len(chunks),
+        "read_seconds": round(read_seconds, 3),
+        "seconds": round(seconds, 3),
+        "transactions_per_second": round(len(transaction_ids) / read_seconds, 1) if read_seconds else None,
+    }
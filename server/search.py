@@ -0,0 +1,77 @@
+import re
+
+from sqlalchemy import column, func, literal_column, select, table
+
+from models import db, Product
+from catalog import apply_filters, CatalogError
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Relative weight of each indexed column in the ranking, in index column order.
+WEIGHTS = {"title": 10.0, "brand": 5.0, "model": 5.0, "description": 1.0}
+FTS_TABLE = "products_fts"
+# Must stay identical to the expression of the ix_products_fulltext index (migration 0005).
+POSTGRES_DOCUMENT = "to_tsvector('simple', {})".format(" || ' ' || ".join(f"coalesce({column}, '')" for column in WEIGHTS))
+
+
+POSTGRES_INDEX = "ix_products_fulltext"
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The full-text index is created by hand in a migration; keep autogenerate from dropping it.
+    if type_ == "index" and name == POSTGRES_INDEX:
+        return False
+    return not (type_ == "table" and name.startswith(FTS_TABLE))
+
+
+def _terms(q):
+    return re.findall(r"\w+", q.lower())[:10]
+
+
+def _sqlite_search(args, terms, limit):
+    # Every term is quoted (so user input can't inject FTS syntax) and prefix-matched for type-ahead.
+    match = " AND ".join(f'"{term}"*' for term in terms)
+    weights = ", ".join(str(w) for w in WEIGHTS.values())
+    fts = table(FTS_TABLE, column("rowid"))
+    score = literal_column(f"bm25({FTS_TABLE}, {weights})")
+    ranked = select(fts.c.rowid.label("product_rowid"), score.label("score")).where(
+        literal_column(FTS_TABLE).op("MATCH")(match))
+
+    # Rank and cut inside the subquery, so only `limit` products are loaded rather than every
+    # match. Filters go in there too (apply_filters returns the select untouched when there are
+    # none), otherwise the LIMIT would be taken before them.
+    joined = ranked.join(Product.__table__, literal_column("products.rowid") == fts.c.rowid)
+    filtered = apply_filters(joined, args)
+    if filtered is not joined:
+        ranked = filtered
+    ranked = ranked.order_by(score).limit(limit).subquery("fts")
+
+    return (Product.query.options(*Product.serialization_options())
+            .join(ranked, literal_column("products.rowid") == ranked.c.product_rowid)
+            .order_by(ranked.c.score).all())
+
+
+def _postgres_search(query, terms):
+    document = literal_column(POSTGRES_DOCUMENT)
+    tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+    return query.filter(document.op("@@")(tsquery)).order_by(func.ts_rank(document, tsquery).desc())
+
+
+def search_products(args):
+    """Ranked full-text search over title, brand, model and description, narrowed by the catalog filters."""
+    terms = _terms(args.get("q") or "")
+    if not terms:
+        raise CatalogError("A search query is required.")
+
+    try:
+        limit = int(args.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise CatalogError("Invalid value for limit.")
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    if db.engine.dialect.name != "postgresql":
+        return _sqlite_search(args, terms, limit)
+    query = _postgres_search(Product.query.options(*Product.serialization_options()), terms)
+    return apply_filters(query, args).limit(limit).all()
@@ -0,0 +1,339 @@
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+from flask import abort, current_app, redirect, request, send_file
+from sqlalchemy import select
+from werkzeug.security import safe_join
+
+from models import db, Image, UploadSession
+
+
+DEFAULTS = {
+    # "s3" for S3 and S3-compatible stores such as MinIO (needs boto3, which reads the usual AWS_* credentials).
+    "STORAGE_BACKEND": os.getenv("STORAGE_BACKEND", "local"),
+    "STORAGE_ROOT": os.getenv("STORAGE_ROOT"),                      # local backend; defaults to ./images
+    "STORAGE_S3_BUCKET": os.getenv("STORAGE_S3_BUCKET"),
+    "STORAGE_S3_ENDPOINT_URL": os.getenv("STORAGE_S3_ENDPOINT_URL"),  # e.g. http://localhost:9000 for MinIO
+    "STORAGE_S3_PREFIX": os.getenv("STORAGE_S3_PREFIX", "images/"),
+    "STORAGE_PUBLIC_URL": os.getenv("STORAGE_PUBLIC_URL"),          # bucket/CDN base URL; otherwise presigned links
+    "STORAGE_SWEEP_AUTOSTART": True,
+    "STORAGE_SWEEP_INTERVAL": 60 * 60,
+    "STORAGE_SWEEP_GRACE": 60 * 60,        # files younger than this may belong to an uncommitted request
+    "STORAGE_SCRATCH_TTL": 24 * 60 * 60,   # abandoned temp files (cut-off uploads, stale resumable parts)
+    # Local backend only. None: Flask sends the bytes. "x-accel-redirect": nginx does, from
+    # IMAGE_ACCEL_PREFIX (an `internal` location aliased to the images folder). "x-sendfile": Apache/lighttpd do.
+    "IMAGE_OFFLOAD": None,
+    "IMAGE_ACCEL_PREFIX": "/protected-images/",
+    "IMAGE_MAX_AGE": 24 * 60 * 60,         # for the older, non content-addressed image URLs
+}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+IMMUTABLE = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+def key_for(url):
+    """The storage key of an /images/... URL as stored in Image.path, or None for foreign URLs."""
+    if "/images/" not in url:
+        return None
+    return url.split("/images/", 1)[1]
+
+
+def current_storage():
+    return current_app.extensions["storage"].backend
+
+
+class LocalStorage:
+    """Files under one folder, keyed by their relative path.
+
+    Keys are content-addressed (blobs are named by their hash, variants by their blob and
+    settings), so putting an existing key only refreshes its modification time.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.scratch = os.path.join(root, "tmp")   # same filesystem, so put() is a rename
+        os.makedirs(self.scratch, exist_ok=True)
+
+    def _path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key, source):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)   # tells the sweeper it is in use again
+            os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(source, path)
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def modified(self, key):
+        try:
+            return os.path.getmtime(self._path(key))
+        except OSError:
+            return None
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+        # Drop folders emptied by the delete (e.g. a removed listing's legacy folder).
+        folder = os.path.dirname(path)
+        while folder != self.root:
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+    @contextmanager
+    def fetch(self, key):
+        yield self._path(key)
+
+    def keys(self):
+        """Yield (key, modified) for every stored file, temp files excluded."""
+        for folder, dirs, files in os.walk(self.root):
+            if folder == self.root and "tmp" in dirs:
+                dirs.remove("tmp")
+            for name in files:
+                path = os.path.join(folder, name)
+                yield os.path.relpath(path, self.root).replace(os.sep, "/"), os.path.getmtime(path)
+
+    def send(self, key, immutable=False):
+        """Serve a stored file with validators and caching headers.
+
+        Content-addressed files never change, so their file name is a strong ETag and
+        browsers and CDNs may cache them for a year without revalidating.
+        """
+        path = self._path(key)
+        if not os.path.isfile(path):
+            abort(404)
+
+        config = current_app.config
+        max_age = IMMUTABLE_MAX_AGE if immutable else config["IMAGE_MAX_AGE"]
+        if immutable:
+            etag = key.rsplit("/", 1)[-1]
+        else:
+            stat = os.stat(path)
+            etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+        if config["IMAGE_OFFLOAD"] == "x-accel-redirect":
+            response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0])
+            response.set_etag(etag)
+            if not request.if_none_match.contains(etag):
+                # Empty body: nginx sends the file (and handles Range) with sendfile().
+                response.headers["X-Accel-Redirect"] = config["IMAGE_ACCEL_PREFIX"] + key
+            else:
+                response.status_code = 304
+        else:
+            # USE_X_SENDFILE (set for "x-sendfile") makes send_file hand the path to the server.
+            # conditional=True answers If-None-Match with 304 and Range with 206.
+            response = send_file(path, etag=etag, conditional=True, max_age=max_age)
+
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = immutable
+        return response
+
+
+class S3Storage:
+    """Objects in an S3 (or S3-compatible) bucket under ``prefix``; same contract as LocalStorage."""
+
+    def __init__(self, bucket, scratch, endpoint_url=None, prefix="", public_url=None):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.scratch = scratch   # local folder for uploads in progress and downloads
+        os.makedirs(scratch, exist_ok=True)
+        self._client = None
+
+    def __getstate__(self):
+        # Sent to the image worker processes; each builds its own client.
+        return {**self.__dict__, "_client": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("STORAGE_BACKEND = 's3' needs boto3 (pip install boto3).")
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def put(self, key, source):
+        extra = {"ContentType": mimetypes.guess_type(key)[0] or "application/octet-stream", "CacheControl": IMMUTABLE}
+        if self._head(key) is not None:
+            # Copying the object onto itself refreshes LastModified for the sweeper without re-uploading it.
+            self.client.copy_object(Bucket=self.bucket, Key=self.prefix + key, MetadataDirective="REPLACE",
+                                    CopySource={"Bucket": self.bucket, "Key": self.prefix + key}, **extra)
+        else:
+            self.client.upload_file(source, self.bucket, self.prefix + key, ExtraArgs=extra)
+        os.remove(source)
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def modified(self, key):
+        head = self._head(key)
+        return head["LastModified"].timestamp() if head else None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    @contextmanager
+    def fetch(self, key):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1], dir=self.scratch)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self.prefix + key, path)
+            yield path
+        finally:
+            os.remove(path)
+
+    def keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", ()):
+                yield obj["Key"][len(self.prefix):], obj["LastModified"].timestamp()
+
+    def send(self, key, immutable=False):
+        if self.public_url:
+            return redirect(f"{self.public_url}/{self.prefix}{key}", 301 if immutable else 302)
+        if not self.exists(key):
+            abort(404)
+        url = self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": self.prefix + key},
+                                                 ExpiresIn=60 * 60)
+        return redirect(url, 302)
+
+
+class Storage:
+    """Picks the configured backend and sweeps it for files no database row refers to anymore.
+
+    File writes are never undone by hand: a blob only becomes part of the catalog when the row
+    pointing at it commits. Blobs left behind by a rollback, and files whose rows were deleted,
+    are removed by the sweeper once they are older than STORAGE_SWEEP_GRACE.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self._stop = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            app.config.setdefault(key, value)
+        self.app = app
+        config = app.config
+
+        root = config["STORAGE_ROOT"] or os.path.join(os.getcwd(), "images")
+        if config["STORAGE_BACKEND"] == "s3":
+            self.backend = S3Storage(config["STORAGE_S3_BUCKET"], os.path.join(root, "tmp"), config["STORAGE_S3_ENDPOINT_URL"],
+                                     config["STORAGE_S3_PREFIX"], config["STORAGE_PUBLIC_URL"])
+        else:
+            self.backend = LocalStorage(root)
+        app.extensions["storage"] = self
+
+        if config["IMAGE_OFFLOAD"] == "x-sendfile":
+            config["USE_X_SENDFILE"] = True
+
+        @app.before_request
+        def _autostart():
+            if app.config["STORAGE_SWEEP_AUTOSTART"] and self._thread is None:
+                self.start()
+
+        @app.cli.command("storage-sweep")
+        @click.option("--dry-run", is_flag=True, help="Only count what would be deleted.")
+        def storage_sweep_command(dry_run):
+            """Delete stored files that no image or upload refers to."""
+            click.echo(self.sweep(dry_run=dry_run))
+
+    def send(self, key, immutable=False):
+        if safe_join("images", key) is None:
+            abort(404)
+        return self.backend.send(key, immutable=immutable)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="storage-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.wait(self.app.config["STORAGE_SWEEP_INTERVAL"]):
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                self.app.logger.exception("Storage sweeper error: %s", e)
+
+    def referenced_keys(self):
+        keys = set()
+        for path, variants in db.session.execute(select(Image.path, Image.variants)).yield_per(1000):
+            key = key_for(path)
+            if key is None:
+                continue
+            keys.add(key)
+            folder = key.rsplit("/", 1)[0]
+            keys.update(f"{folder}/{variant['file']}" for variant in variants or ())
+        keys.update(key_for(path) for path in db.session.scalars(select(UploadSession.path).where(UploadSession.path.is_not(None))))
+        return keys
+
+    def sweep(self, dry_run=False):
+        config = self.app.config
+        now = time.time()
+        cutoff = now - config["STORAGE_SWEEP_GRACE"]
+        referenced = self.referenced_keys()
+        db.session.rollback()
+
+        deleted = 0
+        for key, modified in list(self.backend.keys()):
+            if key in referenced or modified > cutoff:
+                continue
+            # Re-read the time: an upload of the same content may have just reused this blob.
+            modified = self.backend.modified(key)
+            if modified is None or modified > cutoff:
+                continue
+            if not dry_run:
+                self.backend.delete(key)
+            deleted += 1
+
+        scratch_deleted = 0
+        with os.scandir(self.backend.scratch) as entries:
+            for entry in entries:
+                if entry.stat().st_mtime >= now - config["STORAGE_SCRATCH_TTL"]:
+                    continue
+                if not dry_run:
+                    shutil.rmtree(entry.path) if entry.is_dir() else os.remove(entry.path)
+                scratch_deleted += 1
+
+        return {"referenced": len(referenced), "deleted": deleted, "scratch_deleted": scratch_deleted, "dry_run": dry_run}
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER)
+
+
+@pytest.fixture(scope="session")
+def app():
+    scratch = tempfile.mkdtemp()
+    # app.py reads these at import time.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'test.db')}"
+    os.environ["STORAGE_ROOT"] = os.path.join(scratch, "images")
+
+    from app import app
+    from flask_migrate import upgrade
+    app.config.update(
+        TESTING=True,
+        MAIL_QUEUE_AUTOSTART=False,
+        STORAGE_SWEEP_AUTOSTART=False,
+        IMAGE_WORKERS=0,
+        RESPONSE_CACHE_ENABLED=False,   # every request should reach the database
+    )
+    with app.app_context():
+        upgrade(directory=os.path.join(SERVER, "migrations"))   # the schema production gets, not create_all
+    yield app
+    shutil.rmtree(scratch)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    from models import db
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def statements(app, db):
+    """A context manager collecting the (SQL, parameters) of every statement run inside it."""
+    @contextmanager
+    def capture():
+        captured = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            captured.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield captured
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return capture
+
+
+def new_address():
+    return "0x" + uuid.uuid4().hex + uuid.uuid4().hex[:8]
+
+
+@pytest.fixture
+def make_seller(db):
+    """Create a seller with ``count`` listings of two images each, and a buyer with a transaction for each."""
+    from models import User, Product, Image, Transaction
+
+    def make(count):
+        seller = User(email=f"{uuid.uuid4().hex}@seller", name="Seller", address=new_address(), is_seller=True)
+        buyer = User(email=f"{uuid.uuid4().hex}@buyer", name="Buyer", address=new_address())
+        db.session.add_all([seller, buyer])
+        for i in range(count):
+            slug = f"car-{uuid.uuid4()}"
+            product = Product(title=f"Car {i}", brand="BMW", model="M3", slug=slug, year=2020,
+                              price_gwei=10 ** 9, mileage=i, seller=seller)
+            product.images = [Image(path=f"/images/{slug}/{n}.jpg") for n in range(2)]
+            db.session.add(product)
+            db.session.add(Transaction(transaction_id=uuid.uuid4().int % 10 ** 9, product=product,
+                                       seller=seller, buyer=buyer, amount_gwei=10 ** 9))
+        db.session.commit()
+        return seller.address, buyer.address
+    return make
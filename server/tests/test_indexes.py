@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+
+# The hot lookups must be served by an index: SQLite's plan for each statement a route runs
+# may not scan a whole table or sort one. "SCAN t USING INDEX" (an ordered index walk under
+# a LIMIT) is fine; a bare "SCAN t" or "USE TEMP B-TREE FOR ORDER BY" is not.
+FULL_SCAN = re.compile(r"^SCAN \w+$")
+FULL_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+def plans(db, captured):
+    """The EXPLAIN QUERY PLAN lines of every SELECT in ``captured``."""
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        result = []
+        for statement, parameters in captured:
+            if statement.lstrip().upper().startswith("SELECT"):
+                rows = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+                result.append((statement, [row[-1] for row in rows]))
+        return result
+    finally:
+        connection.close()
+
+
+def assert_indexed(db, captured, *indexes):
+    explained = plans(db, captured)
+    assert explained
+    for statement, lines in explained:
+        assert not any(FULL_SCAN.match(line) or line == FULL_SORT for line in lines), (statement, lines)
+    used = " ".join(line for _, lines in explained for line in lines)
+    for index in indexes:
+        assert index in used, (index, explained)
+
+
+@pytest.fixture
+def seeded(make_seller):
+    make_seller(30)   # other sellers' rows, so a missing index would have something to scan
+    return make_seller(3)
+
+
+def test_get_product_uses_the_slug_index(client, db, statements, seeded):
+    slug = client.get(f"/api/seller-products/{seeded[0]}").get_json()["products"][0]["slug"]
+    with statements() as captured:
+        assert client.get(f"/api/get-product/{slug}").status_code == 200
+    assert_indexed(db, captured, "ix_products_slug", "ix_images_product_id")
+
+
+def test_seller_products_use_the_seller_index(client, db, statements, seeded):
+    with statements() as captured:
+        assert client.get(f"/api/seller-products/{seeded[0]}").status_code == 200
+    assert_indexed(db, captured, "ix_products_seller_id_created_at", "sqlite_autoindex_users")
+
+
+def test_newest_listings_walk_the_created_at_index(client, db, statements, seeded):
+    with statements() as captured:
+        assert client.get("/api/products?sort=newest&limit=10").status_code == 200
+    assert_indexed(db, captured, "ix_products_created_at")
+
+
+@pytest.mark.parametrize("role, index", [
+    ("buyer", "ix_transactions_buyer_id_created_at"),
+    ("seller", "ix_transactions_seller_id_created_at"),
+])
+def test_transaction_history_uses_the_party_indexes(client, db, statements, seeded, role, index):
+    seller, buyer = seeded
+    address = buyer if role == "buyer" else seller
+    with statements() as captured:
+        assert client.get(f"/api/transactions?wallet={address}&role={role}").status_code == 200
+    assert_indexed(db, captured, index)
+
+
+def test_transaction_id_lookup_uses_its_index(db, statements, seeded):
+    from models import Transaction
+    with statements() as captured:
+        Transaction.query.filter_by(transaction_id=12345).all()
+    assert_indexed(db, captured, "ix_transactions_transaction_id")
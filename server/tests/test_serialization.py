@@ -0,0 +1,41 @@
+import pytest
+
+
+# Every listing endpoint loads a page with its images, sellers and products in a fixed number
+# of queries, however many rows the page has.
+SIZES = (1, 5, 25)
+
+
+def query_count(statements, client, url):
+    with statements() as captured:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(captured)
+
+
+@pytest.mark.parametrize("url", [
+    "/api/seller-products/{seller}",
+    "/api/get-transactions?wallet={buyer}",
+    "/api/get-transactions?wallet={seller}",
+    "/api/transactions?wallet={buyer}&role=buyer&limit=100",
+])
+def test_query_count_is_flat_per_user(client, statements, make_seller, url):
+    counts = []
+    for size in SIZES:
+        seller, buyer = make_seller(size)
+        counts.append(query_count(statements, client, url.format(seller=seller, buyer=buyer)))
+    assert len(set(counts)) == 1, dict(zip(SIZES, counts))
+
+
+def test_query_count_is_flat_per_page_size(client, statements, make_seller):
+    make_seller(max(SIZES))
+    counts = [query_count(statements, client, f"/api/products?limit={size}") for size in SIZES]
+    assert len(set(counts)) == 1, dict(zip(SIZES, counts))
+
+
+def test_query_count_is_flat_for_the_whole_catalog(client, statements, make_seller):
+    counts = []
+    for size in SIZES:
+        make_seller(size)
+        counts.append(query_count(statements, client, "/api/get-products"))
+    assert len(set(counts)) == 1, dict(zip(SIZES, counts))
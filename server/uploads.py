@@ -0,0 +1,221 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Request, current_app
+from PIL import Image as PILImage, UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from metrics import timed
+from models import db, Image, UploadSession
+from storage import current_storage
+
+
+DEFAULTS = {
+    "MAX_CONTENT_LENGTH": 200 * 1024 * 1024,       # per request, enforced by Werkzeug while parsing
+    "UPLOAD_MAX_FILE_SIZE": 25 * 1024 * 1024,      # per image, for multipart and resumable uploads
+    "UPLOAD_CHUNK_SIZE": 64 * 1024,
+    "UPLOAD_SESSION_TTL": 24 * 60 * 60,            # seconds an unfinished resumable upload is kept
+}
+
+# Image.format as detected by Pillow -> file extension of the stored blob.
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif", "AVIF": ".avif", "HEIF": ".heic"}
+
+
+class UploadError(ValueError):
+    pass
+
+
+class HashingFile:
+    """A temp file in the storage scratch folder that hashes and size-checks every chunk written to it.
+
+    Werkzeug's multipart parser writes uploads into it chunk by chunk, so a file is never held
+    in memory; with local storage it is never copied again either, storing it is a rename.
+    """
+
+    def __init__(self, limit):
+        self._file = tempfile.NamedTemporaryFile(dir=current_storage().scratch, delete=False)
+        self.name = self._file.name
+        self.limit = limit
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge("Image is larger than the upload limit.")
+        self.hash.update(data)
+        return self._file.write(data)
+
+    def close(self):
+        # Called by Werkzeug when the request ends; anything not moved into the store is dropped.
+        self._file.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingFile(current_app.config["UPLOAD_MAX_FILE_SIZE"])
+        # Kept here too: a file cut off by a size limit never makes it into request.files.
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.get("_upload_streams", ()):
+            stream.close()
+
+
+def _extension(path):
+    try:
+        with PILImage.open(path) as im:
+            return EXTENSIONS[im.format]
+    except (UnidentifiedImageError, KeyError):
+        raise UploadError("Unsupported image format.")
+
+
+def _store_blob(path, digest):
+    """Move a fully written temp file into the content-addressed store. Returns its /images URL path.
+
+    Identical bytes always land on the same key, so a photo used by several listings is kept once.
+    """
+    with timed("io"):
+        key = f"blobs/{digest[:2]}/{digest}{_extension(path)}"
+        current_storage().put(key, path)
+    return f"/images/{key}"
+
+
+def store_file(file_storage):
+    """Store a file that arrived in a multipart form (see UploadRequest). Returns its /images URL path."""
+    stream = file_storage.stream
+    stream.flush()
+    return _store_blob(stream.name, stream.hash.hexdigest())
+
+
+def store_stream(fileobj, limit, chunk_size=64 * 1024):
+    """Store an image read from any file object, e.g. a zip member. Returns its /images URL path."""
+    stream = HashingFile(limit)
+    try:
+        try:
+            shutil.copyfileobj(fileobj, stream, chunk_size)
+        except RequestEntityTooLarge:
+            raise UploadError("Image is larger than the upload limit.")
+        stream.flush()
+        return _store_blob(stream.name, stream.hash.hexdigest())
+    finally:
+        stream.close()   # only removes the temp file if it wasn't moved into the store
+
+
+def new_image(url, product_id):
+    """An Image row for a stored blob, reusing the variants already rendered for the same content."""
+    image = Image(path=url, product_id=product_id)
+    rendered = Image.query.filter(Image.path == url, Image.variants.is_not(None)).first()
+    if rendered:
+        image.width, image.height, image.variants = rendered.width, rendered.height, rendered.variants
+    return image
+
+
+# Resumable uploads: the client opens a session, then PATCHes the file in any number of chunks.
+# Whatever reached the disk survives a dropped connection; the client asks for the offset and
+# carries on from there.
+
+def part_path(upload):
+    return os.path.join(current_storage().scratch, f"{upload.id}.part")
+
+
+def upload_offset(upload):
+    path = part_path(upload)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def append_chunk(upload, stream, offset, chunk_size):
+    if upload.path:
+        raise UploadError("Upload is already complete.")
+    if offset != upload_offset(upload):
+        raise UploadError("Offset does not match the uploaded size.")
+
+    with timed("io"), open(part_path(upload), "ab") as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            offset += len(chunk)
+            if offset > upload.size:
+                f.truncate(offset - len(chunk))
+                raise UploadError("Upload is larger than its declared size.")
+            f.write(chunk)
+
+    if offset == upload.size:
+        _finish(upload, chunk_size)
+    return offset
+
+
+def _finish(upload, chunk_size):
+    # The file arrived over several requests, so it is hashed once here in one streaming pass.
+    path = part_path(upload)
+    digest = hashlib.sha256()
+    with timed("io"), open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    try:
+        upload.path = _store_blob(path, digest.hexdigest())
+    except UploadError:
+        os.remove(path)
+        raise
+
+
+def purge_expired_uploads(ttl):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    expired = UploadSession.query.filter(UploadSession.created_at < cutoff).all()
+    for upload in expired:
+        path = part_path(upload)
+        if os.path.exists(path):
+            os.remove(path)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(expired)
+
+
+def stored_urls(files, upload_ids, address):
+    """Store the multipart files and claim the finished resumable uploads of a product form.
+
+    Returns their /images URL paths, files first; the claimed sessions are deleted with the caller's commit.
+    """
+    urls = [store_file(file) for file in files if file.filename]
+    if upload_ids:
+        uploads = UploadSession.query.filter(UploadSession.id.in_(upload_ids), UploadSession.address == address).all()
+        by_id = {upload.id: upload for upload in uploads}
+        for upload_id in upload_ids:
+            upload = by_id.get(upload_id)
+            if upload is None or upload.path is None:
+                raise UploadError(f"Upload {upload_id} is unknown or incomplete.")
+            urls.append(upload.path)
+            db.session.delete(upload)
+    return urls
+
+
+class Uploads:
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for key, value in DEFAULTS.items():
+            if app.config.get(key) is None:   # Flask itself defaults MAX_CONTENT_LENGTH to None
+                app.config[key] = value
+        self.app = app
+        app.request_class = UploadRequest
+        app.extensions["uploads"] = self
+
+        @app.cli.command("uploads-purge")
+        def uploads_purge_command():
+            """Delete resumable uploads older than UPLOAD_SESSION_TTL, finished or not."""
+            click.echo(f"Purged {purge_expired_uploads(app.config['UPLOAD_SESSION_TTL'])} upload(s).")
@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Integer, delete, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload
+
+from models import db, Product, User, Wishlist
+
+
+MAX_BATCH = 500   # product ids per add/remove request
+
+
+class WishlistError(ValueError):
+    pass
+
+
+def product_ids_from(data):
+    """The product ids of an add/remove body: {"product_ids": [...]} or the single {"product_id": ...}."""
+    ids = data.get("product_ids")
+    if ids is None:
+        ids = [data.get("product_id")]
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise WishlistError("product_ids must be a list of product ids.")
+    if len(ids) > MAX_BATCH:
+        raise WishlistError(f"At most {MAX_BATCH} products per request.")
+    return list(dict.fromkeys(ids))
+
+
+def _insert():
+    return (postgresql.insert if db.session.get_bind().dialect.name == "postgresql" else sqlite.insert)(Wishlist)
+
+
+def _count(product_ids, step):
+    """Move the wishlist counters of these products by ``step``.
+
+    Returns their (slug, seller address) rows, which name the response cache entries showing the counts.
+    """
+    if not product_ids:
+        return []
+    seller_address = select(User.address).where(User.id == Product.seller_id).scalar_subquery()
+    return db.session.execute(
+        update(Product)
+        .where(Product.id.in_(product_ids))
+        .values(wishlist_count=Product.wishlist_count + step)
+        .returning(Product.slug, seller_address)
+    ).all()
+
+
+def add_products(user_id, product_ids):
+    """Wishlist the existing products among ``product_ids``. Returns (newly added ids, their _count rows).
+
+    One INSERT ... SELECT: ids that aren't products select nothing, and pairs already in the
+    wishlist are skipped by the unique constraint instead of being looked up first.
+    """
+    rows = select(
+        literal(user_id, Integer), Product.id, literal(datetime.now(timezone.utc), DateTime)
+    ).where(Product.id.in_(product_ids))
+    added = db.session.scalars(
+        _insert()
+        .from_select(["user_id", "product_id", "created_at"], rows)
+        .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+        .returning(Wishlist.product_id)
+    ).all()
+    return added, _count(added, 1)
+
+
+def remove_products(user_id, product_ids):
+    """Returns (removed ids, their _count rows)."""
+    removed = db.session.scalars(
+        delete(Wishlist)
+        .where(Wishlist.user_id == user_id, Wishlist.product_id.in_(product_ids))
+        .returning(Wishlist.product_id)
+    ).all()
+    return removed, _count(removed, -1)
+
+
+def wishlist_products(user_id):
+    """The products a user has wishlisted, most recently saved first, in a single query."""
+    return db.session.scalars(
+        select(Product)
+        .join(Wishlist, Wishlist.product_id == Product.id)
+        .where(Wishlist.user_id == user_id)
+        .options(joinedload(Product.images), joinedload(Product.seller))
+        .order_by(Wishlist.created_at.desc(), Wishlist.id.desc())
+    ).unique().all()